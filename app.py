@@ -5,10 +5,30 @@ import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from PIL import Image, ImageOps
 import json
 import os
 import io
 import base64
+import bisect
+import collections
+import csv
+import re
+import contextlib
+import functools
+import hashlib
+import logging
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("nilons_ticketing")
+metrics_logger = logging.getLogger("nilons_ticketing.metrics")
 
 # Page configuration
 st.set_page_config(
@@ -103,6 +123,70 @@ IT_STAFF = {
     'admin': {'password': 'admin123', 'name': 'Admin'},
 }
 
+TICKET_TYPES = ["SAP", "Botree"]
+
+# Ticket list pagination
+TICKET_PAGE_SIZES = [10, 25, 50, 100]
+# Columns shown in the compact ticket list
+TICKET_SUMMARY_COLUMNS = [
+    "Ticket ID",
+    "Status",
+    "Incident Category",
+    "Type of Query",
+    "SS/DB/DP Name",
+    "Received Date",
+    "Received Time",
+    "IT Member Assigned"
+]
+
+# Typed ticket columns: repeated values are stored as categoricals, and
+# date + time pairs are combined into datetime64 columns at load
+TICKET_CATEGORY_COLUMNS = [
+    "Type of Query",
+    "SS/DB/DP Name",
+    "SS/DB/DP Code",
+    "City",
+    "State",
+    "Incident Category",
+    "Call Received From",
+    "Received Date",
+    "Status",
+    "IT Member Assigned",
+    "Closing Date"
+]
+TICKET_TIMESTAMP_COLUMNS = {
+    "Received At": ("Received Date", "Received Time"),
+    "Closed At": ("Closing Date", "Closing Time"),
+}
+
+# Columns covered by the ticket search box
+SEARCH_FIELDS = [
+    "Ticket ID",
+    "Subject",
+    "Action Taken",
+    "Type of Query",
+    "SS/DB/DP Name",
+    "SS/DB/DP Code",
+    "City",
+    "Call Received From"
+]
+
+# Dashboard buckets: (label, upper bound in hours)
+RESOLUTION_BUCKETS = [
+    ("< 4 hours", 4),
+    ("4-24 hours", 24),
+    ("1-3 days", 72),
+    ("3-7 days", 168),
+    ("> 7 days", float('inf'))
+]
+BACKLOG_AGE_BUCKETS = [
+    ("< 1 day", 24),
+    ("1-3 days", 72),
+    ("3-7 days", 168),
+    ("7-30 days", 720),
+    ("> 30 days", float('inf'))
+]
+
 # Incident categories
 INCIDENT_CATEGORIES = [
     "Billing Issue",
@@ -121,274 +205,3291 @@ INCIDENT_CATEGORIES = [
     "Training"
 ]
 
+# Google API configuration
+CREDENTIALS_FILE = 'credentials.json'
+GOOGLE_SCOPES = ['https://spreadsheets.google.com/feeds',
+                 'https://www.googleapis.com/auth/drive']
+SPREADSHEET_NAME = "Nilons IT Tickets"
+# Set this to open the spreadsheet directly instead of searching Drive by name
+SPREADSHEET_KEY = os.environ.get('NILONS_SPREADSHEET_KEY', '')
+WORKSHEET_CACHE_TTL = 600  # seconds
+DRIVE_FOLDER_NAME = "Nilons Ticket Images"
+# Requests per minute the API gateway allows for each quota bucket, and the burst size
+GOOGLE_RATE_LIMITS = {
+    'sheets_read': 60,
+    'sheets_write': 60,
+    'drive': 600,
+}
+GOOGLE_BURST = 10
+# Retries with jittered exponential backoff on 429/5xx
+GOOGLE_RETRY_ATTEMPTS = 5
+GOOGLE_RETRY_BASE = 1  # seconds
+GOOGLE_RETRY_MAX = 32  # seconds
+GOOGLE_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Memory budget for decoded attachment previews shared by all sessions
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Re-encoded attachment versions: variant -> (max width/height in px, JPEG quality)
+IMAGE_VARIANTS = {
+    'web': (1600, 80),
+    'thumb': (240, 70),
+}
+# Resumable upload chunk size (must be a multiple of 256 KB)
+DRIVE_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+# How long a ticket snapshot is served before the sheet is read again
+TICKET_CACHE_TTL = 30  # seconds
+# Between full re-reads, snapshots only fetch appended and changed rows
+FULL_SYNC_INTERVAL = 600  # seconds
+# How long the ticket-ID -> row index is trusted before it is checked against the sheet
+TICKET_INDEX_TTL = 300  # seconds
+
+# Local storage (used when Google Sheets is not configured, and for ticket IDs)
+LOCAL_DB_FILE = 'local_tickets.db'
+IMAGES_DIR = "ticket_images"
+# Unreferenced attachments younger than this are never garbage-collected
+ATTACHMENT_GC_GRACE = 24 * 3600  # seconds
+# Background write-behind queue for new tickets (Google mode)
+OUTBOX_SPOOL_DIR = os.path.join(IMAGES_DIR, "outbox")
+OUTBOX_RETRY_BASE = 5  # seconds, doubled after every failed attempt
+OUTBOX_RETRY_MAX = 600  # seconds
+OUTBOX_LEASE = 300  # seconds an entry stays claimed by one worker
+OUTBOX_IDLE_POLL = 30  # seconds between checks when the queue is empty
+OUTBOX_IMAGE_ATTEMPTS = 5  # failed uploads before a ticket is written without its image
+# Closed tickets are moved to per-month archives this long after closing (0, the default, turns archiving off)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('NILONS_ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_INTERVAL = 24 * 3600  # seconds between scheduled archival runs
+# Local mode: one SQLite file per month (ticket_archive/2025-01.db)
+ARCHIVE_DIR = "ticket_archive"
+# How long the list of archived months and their tickets are cached
+ARCHIVE_CACHE_TTL = 600  # seconds
+# Suffix that keeps ticket IDs unique when several machines share one spreadsheet
+NODE_ID = os.environ.get('NILONS_NODE_ID', '')
+# Ticket store: 'sheets', 'sqlite', 'mirror' (SQLite mirrored to Google Sheets)
+# or 'csv'. Empty means Google Sheets when credentials.json exists and the
+# local SQLite database otherwise
+STORAGE_BACKEND = os.environ.get('NILONS_STORAGE_BACKEND', '').strip().lower()
+CSV_DIR = "ticket_csv"
+SHEETS_APPEND_CHUNK = 500  # rows per append_rows request
+# Columns an imported ticket must have (the required fields of the submit form)
+IMPORT_REQUIRED_FIELDS = [
+    'type_of_query',
+    'ss_db_dp_name',
+    'incident_category',
+    'subject',
+    'call_received_from'
+]
+# Mirror mode: local changes are pushed this long after they are made (so
+# bursts go out together), and the sheet is checked for edits on the interval
+MIRROR_PUSH_DELAY = 5  # seconds
+MIRROR_INTERVAL = 60  # seconds
+MIRROR_LEASE = 300  # seconds one server process holds the mirror
+# Local ticket fields, in the same order as SHEET_HEADERS
+LOCAL_FIELDS = [
+    'ticket_id',
+    'type_of_query',
+    'ss_db_dp_name',
+    'ss_db_dp_code',
+    'city',
+    'state',
+    'incident_category',
+    'subject',
+    'call_received_from',
+    'received_date',
+    'received_time',
+    'status',
+    'it_member_assigned',
+    'closing_date',
+    'closing_time',
+    'action_taken',
+    'image_url'
+]
+
+# Worksheet columns, in sheet order
+SHEET_HEADERS = [
+    "Ticket ID",
+    "Type of Query",
+    "SS/DB/DP Name",
+    "SS/DB/DP Code",
+    "City",
+    "State",
+    "Incident Category",
+    "Subject",
+    "Call Received From",
+    "Received Date",
+    "Received Time",
+    "Status",
+    "IT Member Assigned",
+    "Closing Date",
+    "Closing Time",
+    "Action Taken",
+    "Image URL"
+]
+
+@st.cache_resource(show_spinner=False)
+def _metrics():
+    """Process-wide timing spans and cache hit/miss counters"""
+    return {
+        # span name -> {'count', 'total', 'max'} (seconds, inclusive of nested spans)
+        'spans': {},
+        # cache name -> {'hits', 'misses'}
+        'caches': {},
+        'reruns': {'count': 0, 'total': 0.0},
+        # The rerun being measured on this thread, if any (see begin_rerun_metrics)
+        'current': threading.local(),
+        'lock': threading.Lock(),
+    }
+
+def timed(func):
+    """Decorator recording every call of func as a timing span named after it"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with timing_span(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextlib.contextmanager
+def timing_span(name):
+    """Record how long the enclosed block takes, process-wide and for the current rerun"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics = _metrics()
+        with metrics['lock']:
+            span = metrics['spans'].setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            span['count'] += 1
+            span['total'] += elapsed
+            span['max'] = max(span['max'], elapsed)
+        rerun = getattr(metrics['current'], 'rerun', None)
+        if rerun is not None:
+            span = rerun['spans'].setdefault(name, {'count': 0, 'total': 0.0})
+            span['count'] += 1
+            span['total'] += elapsed
+
+def record_cache_access(name, hit):
+    """Count a hit or miss of one of the app's caches"""
+    metrics = _metrics()
+    with metrics['lock']:
+        counters = metrics['caches'].setdefault(name, {'hits': 0, 'misses': 0})
+        counters['hits' if hit else 'misses'] += 1
+
+def _record_api_call(operation):
+    """Count a Google API request against the rerun (and so the session) that made it"""
+    rerun = getattr(_metrics()['current'], 'rerun', None)
+    if rerun is not None:
+        rerun['api_calls'][operation] += 1
+
+def begin_rerun_metrics():
+    """Start measuring the script rerun running on this thread"""
+    _metrics()['current'].rerun = {
+        'started': time.perf_counter(),
+        'spans': {},
+        'api_calls': collections.Counter(),
+    }
+
+def end_rerun_metrics():
+    """Finish the current rerun: keep its timings in the session and log them as one JSON line"""
+    metrics = _metrics()
+    rerun = getattr(metrics['current'], 'rerun', None)
+    if rerun is None:
+        return
+    metrics['current'].rerun = None
+    total = time.perf_counter() - rerun['started']
+    with metrics['lock']:
+        metrics['reruns']['count'] += 1
+        metrics['reruns']['total'] += total
+    
+    summary = {
+        'total_ms': round(1000 * total, 1),
+        'spans': {
+            name: {'count': span['count'], 'total_ms': round(1000 * span['total'], 1)}
+            for name, span in sorted(rerun['spans'].items(), key=lambda item: -item[1]['total'])
+        },
+        'api_calls': dict(rerun['api_calls']),
+    }
+    st.session_state.perf_last_rerun = summary
+    session_calls = st.session_state.get('perf_session_api_calls', collections.Counter())
+    session_calls.update(rerun['api_calls'])
+    st.session_state.perf_session_api_calls = session_calls
+    metrics_logger.info(json.dumps({'event': 'rerun', **summary}))
+
+def metrics_snapshot():
+    """All process-wide counters as a JSON-serializable dict"""
+    metrics = _metrics()
+    with metrics['lock']:
+        spans = {
+            name: {
+                'count': span['count'],
+                'total_ms': round(1000 * span['total'], 3),
+                'avg_ms': round(1000 * span['total'] / span['count'], 3),
+                'max_ms': round(1000 * span['max'], 1),
+            }
+            for name, span in metrics['spans'].items()
+        }
+        caches = {
+            name: dict(counters, hit_rate=round(counters['hits'] / max(1, counters['hits'] + counters['misses']), 3))
+            for name, counters in metrics['caches'].items()
+        }
+        reruns = dict(metrics['reruns'])
+    return {
+        'reruns': reruns,
+        'spans': spans,
+        'caches': caches,
+        'google_api': get_google_api_stats(),
+    }
+
+def metrics_prometheus():
+    """All process-wide counters in the Prometheus text exposition format"""
+    snapshot = metrics_snapshot()
+    lines = [
+        "# TYPE nilons_reruns_total counter",
+        f"nilons_reruns_total {snapshot['reruns']['count']}",
+        "# TYPE nilons_rerun_seconds_total counter",
+        f"nilons_rerun_seconds_total {snapshot['reruns']['total']:.6f}",
+        "# TYPE nilons_span_calls_total counter",
+    ]
+    lines += [f'nilons_span_calls_total{{span="{name}"}} {span["count"]}' for name, span in snapshot['spans'].items()]
+    lines.append("# TYPE nilons_span_seconds_total counter")
+    lines += [f'nilons_span_seconds_total{{span="{name}"}} {span["total_ms"] / 1000:.6f}' for name, span in snapshot['spans'].items()]
+    for kind in ('hits', 'misses'):
+        lines.append(f"# TYPE nilons_cache_{kind}_total counter")
+        lines += [f'nilons_cache_{kind}_total{{cache="{name}"}} {counters[kind]}' for name, counters in snapshot['caches'].items()]
+    for kind in ('calls', 'errors', 'retries', 'coalesced'):
+        lines.append(f"# TYPE nilons_google_api_{kind}_total counter")
+        lines += [
+            f'nilons_google_api_{kind}_total{{operation="{operation}"}} {counters[kind]}'
+            for operation, counters in snapshot['google_api'].items()
+        ]
+    return "\n".join(lines) + "\n"
+
+@st.cache_resource(show_spinner=False)
+def _google_client_pool(creds_file, creds_mtime):
+    """Build the process-wide Google clients (shared by every session and rerun)
+
+    The credentials object is refreshed lazily by the authorized HTTP
+    sessions whenever its token expires, so the pool only has to be rebuilt
+    after an auth failure (see reset_google_sheets_client) or when
+    credentials.json changes on disk (creds_mtime is part of the cache key).
+    """
+    creds = Credentials.from_service_account_file(creds_file, scopes=GOOGLE_SCOPES)
+    client = gspread.authorize(creds)
+    drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    return {
+        'credentials': creds,
+        'client': client,
+        'drive_service': drive_service,
+        'spreadsheet': None,
+        'drive_folder_id': None,
+        # ticket type -> {'worksheet', 'headers', 'loaded_at'}
+        'worksheets': {},
+        'sheets_lock': threading.RLock(),
+        # httplib2 (used by the Drive client) is not thread-safe
+        'drive_lock': threading.RLock(),
+    }
+
+@st.cache_resource(show_spinner=False)
+def _google_pool_failures():
+    """Process-wide {credentials file: (mtime, error)} for credentials that could not be loaded"""
+    return {}
+
+def _get_google_client_pool():
+    """Return the shared Google client pool, or None when credentials are missing or unusable
+
+    cache_resource doesn't cache exceptions, so a credentials.json that
+    fails to load is remembered here (and logged once) instead of being
+    retried on every call until the file changes.
+    """
+    if not os.path.exists(CREDENTIALS_FILE):
+        return None
+    creds_mtime = os.path.getmtime(CREDENTIALS_FILE)
+    failures = _google_pool_failures()
+    failed = failures.get(CREDENTIALS_FILE)
+    if failed is not None and failed[0] == creds_mtime:
+        return None
+    try:
+        return _google_client_pool(CREDENTIALS_FILE, creds_mtime)
+    except Exception as e:
+        logger.error("Could not load Google credentials from %s, using local storage: %s", CREDENTIALS_FILE, e)
+        failures[CREDENTIALS_FILE] = (creds_mtime, str(e))
+        return None
+
+def google_credentials_error():
+    """Why credentials.json could not be loaded, or None"""
+    failed = _google_pool_failures().get(CREDENTIALS_FILE)
+    if failed is None or not os.path.exists(CREDENTIALS_FILE) or failed[0] != os.path.getmtime(CREDENTIALS_FILE):
+        return None
+    return failed[1]
+
+def _drive_lock():
+    """Lock serializing Drive calls on the shared service object"""
+    pool = _get_google_client_pool()
+    return pool['drive_lock'] if pool is not None else contextlib.nullcontext()
+
+def reset_google_sheets_client():
+    """Drop the shared Google clients so the next call re-authenticates"""
+    _google_client_pool.clear()
+    _google_pool_failures().clear()
+
+def _is_auth_error(error):
+    """Check whether a Google API error means the credentials are no longer valid"""
+    if isinstance(error, RefreshError):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code == 401
+    if isinstance(error, HttpError):
+        return error.resp.status == 401
+    return False
+
+def _handle_google_error(error, ticket_type=None):
+    """Drop cached Google state that the error shows to be invalid
+
+    Auth failures rebuild the whole client pool on the next call; a missing
+    range or worksheet only drops the cached worksheet handle.
+    """
+    if _is_auth_error(error):
+        reset_google_sheets_client()
+    elif isinstance(error, gspread.exceptions.APIError) and error.response.status_code in (400, 404):
+        invalidate_worksheet_cache(ticket_type)
+
+@st.cache_resource(show_spinner=False)
+def _google_gateway():
+    """Process-wide rate limiter, request coalescing and call statistics for Google APIs"""
+    now = time.monotonic()
+    return {
+        'buckets': {
+            api: {'tokens': float(GOOGLE_BURST), 'updated': now, 'rate': limit / 60.0}
+            for api, limit in GOOGLE_RATE_LIMITS.items()
+        },
+        # (operation, key) -> {'done': Event, 'result', 'error'} for reads in flight
+        'inflight': {},
+        # operation -> counters, see get_google_api_stats
+        'stats': {},
+        'lock': threading.Lock(),
+    }
+
+def google_request(api, operation, call, key=None, idempotent=True):
+    """Make one Google API call through the shared gateway and return its result
+
+    api is the quota bucket ('sheets_read', 'sheets_write' or 'drive') the
+    call is paced by. 429 and 5xx responses are retried with jittered
+    exponential backoff; calls that are not idempotent (appends, creates)
+    are only retried on 429, where Google did not apply the request.
+    Reads given a key are coalesced: concurrent callers asking for the same
+    (operation, key) share one request, so its result must not be modified.
+    """
+    gateway = _google_gateway()
+    if key is None:
+        return _google_call(gateway, api, operation, call, idempotent)
+    
+    inflight_key = (operation, key)
+    with gateway['lock']:
+        pending = gateway['inflight'].get(inflight_key)
+        owner = pending is None
+        if owner:
+            pending = {'done': threading.Event(), 'result': None, 'error': None}
+            gateway['inflight'][inflight_key] = pending
+        else:
+            _google_stats(gateway, operation)['coalesced'] += 1
+    
+    if not owner:
+        pending['done'].wait()
+        if pending['error'] is not None:
+            raise pending['error']
+        return pending['result']
+    
+    try:
+        pending['result'] = _google_call(gateway, api, operation, call, idempotent)
+        return pending['result']
+    except Exception as e:
+        pending['error'] = e
+        raise
+    finally:
+        with gateway['lock']:
+            gateway['inflight'].pop(inflight_key, None)
+        pending['done'].set()
+
+def _google_stats(gateway, operation):
+    """Counters for one operation (caller holds the gateway lock)"""
+    return gateway['stats'].setdefault(operation, {
+        'calls': 0,
+        'errors': 0,
+        'retries': 0,
+        'coalesced': 0,
+        'throttled_seconds': 0.0,
+        'latency_total': 0.0,
+        'latency_max': 0.0,
+    })
+
+def _google_error_status(error):
+    """HTTP status of a Google API error, or None"""
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return None
+
+def _google_call(gateway, api, operation, call, idempotent):
+    """Run call() under the rate limiter, retrying transient failures"""
+    attempt = 0
+    while True:
+        _take_google_token(gateway, api, operation)
+        _record_api_call(operation)
+        started = time.monotonic()
+        try:
+            with timing_span(f"google.{operation}"):
+                result = call()
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            status = _google_error_status(e)
+            # Connection errors (OSError) are safe to retry only for idempotent calls
+            transient = status in GOOGLE_RETRY_STATUSES or (status is None and isinstance(e, OSError))
+            retry = (status == 429 or (idempotent and transient)) and attempt < GOOGLE_RETRY_ATTEMPTS
+            with gateway['lock']:
+                stats = _google_stats(gateway, operation)
+                stats['calls'] += 1
+                stats['latency_total'] += elapsed
+                stats['latency_max'] = max(stats['latency_max'], elapsed)
+                if retry:
+                    stats['retries'] += 1
+                else:
+                    stats['errors'] += 1
+            if not retry:
+                raise
+            
+            delay = random.uniform(0, min(GOOGLE_RETRY_MAX, GOOGLE_RETRY_BASE * 2 ** attempt))
+            logger.warning("Google %s failed (%s), retry %d in %.1fs", operation, status or e, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        
+        elapsed = time.monotonic() - started
+        with gateway['lock']:
+            stats = _google_stats(gateway, operation)
+            stats['calls'] += 1
+            stats['latency_total'] += elapsed
+            stats['latency_max'] = max(stats['latency_max'], elapsed)
+        return result
+
+def _take_google_token(gateway, api, operation):
+    """Wait until the api's token bucket allows another request"""
+    waited = 0.0
+    while True:
+        with gateway['lock']:
+            bucket = gateway['buckets'][api]
+            now = time.monotonic()
+            bucket['tokens'] = min(GOOGLE_BURST, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                if waited:
+                    _google_stats(gateway, operation)['throttled_seconds'] += waited
+                return
+            delay = (1 - bucket['tokens']) / bucket['rate']
+        time.sleep(delay)
+        waited += delay
+
+def get_google_api_stats():
+    """Per-operation Google API counters: calls, errors, retries, coalesced, throttled_seconds, avg_ms, max_ms"""
+    gateway = _google_gateway()
+    with gateway['lock']:
+        stats = {operation: dict(counters) for operation, counters in gateway['stats'].items()}
+    for counters in stats.values():
+        latency_total = counters.pop('latency_total')
+        counters['avg_ms'] = round(1000 * latency_total / counters['calls'], 1) if counters['calls'] else 0.0
+        counters['max_ms'] = round(1000 * counters.pop('latency_max'), 1)
+    return stats
+
 # Google Sheets setup
+@timed
 def get_google_sheets_client():
-    """Initialize Google Sheets client"""
+    """Get the shared Google Sheets client and Drive service"""
     try:
-        # Check if credentials file exists
-        creds_file = 'credentials.json'
-        if not os.path.exists(creds_file):
-            st.warning("⚠️ Google Sheets credentials not found. Using local storage mode.")
+        pool = _get_google_client_pool()
+        if pool is None:
+            if google_credentials_error() is None:
+                st.warning("⚠️ Google Sheets credentials not found. Using local storage mode.")
             return None, None
         
-        # Define the scope
-        scope = ['https://spreadsheets.google.com/feeds',
-                'https://www.googleapis.com/auth/drive']
-        
-        # Load credentials
-        creds = Credentials.from_service_account_file(creds_file, scopes=scope)
-        client = gspread.authorize(creds)
-        
-        # Create Drive service
-        drive_service = build('drive', 'v3', credentials=creds)
-        
-        return client, drive_service
+        return pool['client'], pool['drive_service']
     except Exception as e:
         st.error(f"Error connecting to Google Sheets: {e}")
         return None, None
 
+def _open_spreadsheet(client):
+    """Open the tickets spreadsheet once and keep it in the client pool"""
+    pool = _get_google_client_pool()
+    if pool is not None and pool['client'] is client:
+        if pool['spreadsheet'] is None:
+            pool['spreadsheet'] = _open_spreadsheet_uncached(client)
+        return pool['spreadsheet']
+    return _open_spreadsheet_uncached(client)
+
+def _open_spreadsheet_uncached(client):
+    """Open the tickets spreadsheet by key
+
+    Without NILONS_SPREADSHEET_KEY the name is looked up once (a Drive
+    search) and the key it resolves to is kept in the local meta table,
+    so later pool builds, in this or another server process, open by key.
+    """
+    key = SPREADSHEET_KEY
+    conn = None
+    if not key:
+        conn = _local_connection()
+        key = _get_meta(conn, 'spreadsheet_key')
+    if key:
+        try:
+            return google_request('sheets_read', 'open_spreadsheet', lambda: client.open_by_key(key))
+        except gspread.exceptions.SpreadsheetNotFound:
+            if conn is None:
+                raise
+            # The remembered spreadsheet is gone; look it up by name again
+            conn.execute("DELETE FROM meta WHERE key = 'spreadsheet_key'")
+
+    spreadsheet = google_request('sheets_read', 'open_spreadsheet', lambda: client.open(SPREADSHEET_NAME))
+    _set_meta(conn, 'spreadsheet_key', spreadsheet.id)
+    return spreadsheet
+
+def _worksheet_cache(client):
+    """Return the per-ticket-type worksheet cache for a pooled client"""
+    pool = _get_google_client_pool()
+    if pool is not None and pool['client'] is client:
+        return pool['worksheets'], pool['sheets_lock']
+    return {}, threading.RLock()
+
+def invalidate_worksheet_cache(ticket_type=None):
+    """Forget cached worksheet handles so the next access fetches them again"""
+    pool = _get_google_client_pool()
+    if pool is None:
+        return
+    with pool['sheets_lock']:
+        if ticket_type is None:
+            pool['worksheets'].clear()
+        else:
+            pool['worksheets'].pop(ticket_type, None)
+
+@timed
+def _load_worksheet_entry(client, ticket_type):
+    """Fetch (or create) the worksheet for a ticket type along with its header row"""
+    spreadsheet = _open_spreadsheet(client)
+    worksheet_name = f"{ticket_type} Tickets"
+    
+    try:
+        worksheet = google_request('sheets_read', 'worksheet', lambda: spreadsheet.worksheet(worksheet_name))
+        headers = google_request('sheets_read', 'row_values', lambda: worksheet.row_values(1)) or list(SHEET_HEADERS)
+    except gspread.exceptions.WorksheetNotFound:
+        # Create worksheet if it doesn't exist
+        worksheet = google_request(
+            'sheets_write', 'add_worksheet',
+            lambda: spreadsheet.add_worksheet(title=worksheet_name, rows="1000", cols="20"),
+            idempotent=False
+        )
+        google_request('sheets_write', 'append_row', lambda: worksheet.append_row(SHEET_HEADERS), idempotent=False)
+        headers = list(SHEET_HEADERS)
+    
+    return {
+        'worksheet': worksheet,
+        'headers': headers,
+        'loaded_at': time.monotonic(),
+    }
+
+def _get_worksheet_entry(client, ticket_type):
+    """Get the cached worksheet entry for a ticket type, reloading it after the TTL"""
+    worksheets, lock = _worksheet_cache(client)
+    
+    entry = worksheets.get(ticket_type)
+    if entry and time.monotonic() - entry['loaded_at'] < WORKSHEET_CACHE_TTL:
+        record_cache_access('worksheet', True)
+        return entry
+    record_cache_access('worksheet', False)
+    
+    # Only one session loads (and possibly creates) the worksheet at a time
+    with lock:
+        entry = worksheets.get(ticket_type)
+        if entry is None or time.monotonic() - entry['loaded_at'] >= WORKSHEET_CACHE_TTL:
+            entry = _load_worksheet_entry(client, ticket_type)
+            worksheets[ticket_type] = entry
+        return entry
+
+@timed
 def get_or_create_worksheet(client, ticket_type):
     """Get or create worksheet for ticket type"""
     if client is None:
         return None
     
     try:
-        # Replace with your Google Sheets URL or ID
-        spreadsheet_name = "Nilons IT Tickets"
-        
         try:
-            spreadsheet = client.open(spreadsheet_name)
-        except:
-            st.error(f"Spreadsheet '{spreadsheet_name}' not found. Please create it first.")
+            _open_spreadsheet(client)
+        except Exception as e:
+            _handle_google_error(e)
+            st.error(f"Spreadsheet '{SPREADSHEET_NAME}' not found. Please create it first.")
             return None
         
-        worksheet_name = f"{ticket_type} Tickets"
-        
-        try:
-            worksheet = spreadsheet.worksheet(worksheet_name)
-        except:
-            # Create worksheet if it doesn't exist
-            worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows="1000", cols="20")
-            
-            # Add headers
-            headers = [
-                "Ticket ID",
-                "Type of Query",
-                "SS/DB/DP Name",
-                "SS/DB/DP Code",
-                "City",
-                "State",
-                "Incident Category",
-                "Subject",
-                "Call Received From",
-                "Received Date",
-                "Received Time",
-                "Status",
-                "IT Member Assigned",
-                "Closing Date",
-                "Closing Time",
-                "Action Taken",
-                "Image URL"
-            ]
-            worksheet.append_row(headers)
-        
-        return worksheet
+        return _get_worksheet_entry(client, ticket_type)['worksheet']
     except Exception as e:
+        _handle_google_error(e, ticket_type)
         st.error(f"Error accessing worksheet: {e}")
         return None
 
+def get_worksheet_headers(client, ticket_type):
+    """Get the cached header row of the worksheet for ticket type"""
+    if client is None:
+        return list(SHEET_HEADERS)
+    return _get_worksheet_entry(client, ticket_type)['headers']
+
+@timed
 def upload_image_to_drive(drive_service, image_file, ticket_id):
     """Upload image to Google Drive and return shareable URL"""
     try:
-        # Create a folder for ticket images if it doesn't exist
-        folder_name = "Nilons Ticket Images"
-        
-        # Search for the folder
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-        folders = results.get('files', [])
-        
-        if folders:
-            folder_id = folders[0]['id']
-        else:
-            # Create the folder
-            folder_metadata = {
-                'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = drive_service.files().create(body=folder_metadata, fields='id').execute()
-            folder_id = folder.get('id')
-        
-        # Prepare the file for upload
+        return _upload_image_with_variants(
+            drive_service, image_file, f"{ticket_id}_{image_file.name}", image_file.type
+        )
+    except Exception as e:
+        _handle_google_error(e)
+        st.error(f"Error uploading image to Google Drive: {e}")
+        return None
+
+def _get_drive_folder_id(drive_service):
+    """Resolve the ticket images folder once per client pool, creating it if needed"""
+    pool = _get_google_client_pool()
+    pooled = pool is not None and pool['drive_service'] is drive_service
+    if pooled and pool['drive_folder_id']:
+        record_cache_access('drive_folder', True)
+        return pool['drive_folder_id']
+    record_cache_access('drive_folder', False)
+    
+    # Search for the folder
+    query = f"name='{DRIVE_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    results = google_request('drive', 'files.list', drive_service.files().list(q=query, fields="files(id, name)").execute)
+    folders = results.get('files', [])
+    
+    if folders:
+        folder_id = folders[0]['id']
+    else:
+        # Create the folder
+        folder_metadata = {
+            'name': DRIVE_FOLDER_NAME,
+            'mimeType': 'application/vnd.google-apps.folder'
+        }
+        folder = google_request(
+            'drive', 'files.create',
+            drive_service.files().create(body=folder_metadata, fields='id').execute,
+            idempotent=False
+        )
+        folder_id = folder.get('id')
+    
+    if pooled:
+        pool['drive_folder_id'] = folder_id
+    return folder_id
+
+def _upload_file_to_drive(drive_service, file_obj, filename, mimetype, app_properties=None):
+    """Upload a file to the ticket images folder and return {'id', 'webViewLink'} (raises on error)
+
+    The file is streamed from file_obj in DRIVE_UPLOAD_CHUNK_SIZE chunks
+    by a resumable upload, without copying it into memory first.
+    """
+    with _drive_lock():
         file_metadata = {
-            'name': f"{ticket_id}_{image_file.name}",
-            'parents': [folder_id]
+            'name': filename,
+            'parents': [_get_drive_folder_id(drive_service)]
         }
+        if app_properties:
+            file_metadata['appProperties'] = app_properties
         
-        # Create file content from uploaded file
+        file_obj.seek(0)
         media = MediaIoBaseUpload(
-            io.BytesIO(image_file.read()),
-            mimetype=image_file.type,
+            file_obj,
+            mimetype=mimetype,
+            chunksize=DRIVE_UPLOAD_CHUNK_SIZE,
             resumable=True
         )
         
         # Upload the file
-        file = drive_service.files().create(
+        request = drive_service.files().create(
             body=file_metadata,
             media_body=media,
-            fields='id, webViewLink, webContentLink'
-        ).execute()
+            fields='id, webViewLink'
+        )
+        return google_request('drive', 'files.create', request.execute, idempotent=False)
+
+@timed
+def _upload_image_with_variants(drive_service, file_obj, filename, mimetype):
+    """Upload an image plus its web-optimized and thumbnail versions, returning the original's URL
+
+    Images are content-addressed: the file is named after its SHA-256, and
+    if the same bytes were uploaded before (by this server, or by another
+    one sharing the Drive folder) the existing link is reused.
+    The variant file IDs are stored in the original's appProperties, so the
+    Image URL column keeps pointing at the original.
+    """
+    sha256 = _hash_file(file_obj)
+    
+    # Hold the Drive lock throughout so two sessions don't upload the same bytes
+    with _drive_lock():
+        known = _find_attachment(sha256, 'drive') or _find_drive_attachment(drive_service, sha256)
+        if known:
+            return known['url']
+        
+        name = sha256 + _attachment_extension(filename)
+        variant_ids = {}
+        for variant, data in make_image_variants(file_obj).items():
+            uploaded = _upload_file_to_drive(
+                drive_service, io.BytesIO(data), image_variant_path(name, variant), 'image/jpeg'
+            )
+            variant_ids[variant] = uploaded['id']
         
-        # Make the file publicly accessible
-        permission = {
-            'type': 'anyone',
-            'role': 'reader'
+        app_properties = {'sha256': sha256}
+        app_properties.update({f"{variant}_file_id": file_id for variant, file_id in variant_ids.items()})
+        original = _upload_file_to_drive(drive_service, file_obj, name, mimetype, app_properties)
+        _share_drive_file(drive_service, original['id'])
+        
+        url = original.get('webViewLink', '')
+        file_obj.seek(0, os.SEEK_END)
+        _record_attachment(sha256, 'drive', original['id'], url, variant_ids, file_obj.tell())
+        return url
+
+def _share_drive_file(drive_service, file_id):
+    """Make one uploaded file readable by anyone with its link
+
+    Only the original is shared (the ticket's Image URL points at it;
+    previews are fetched server-side); the folder itself stays private, so a link to
+    one screenshot doesn't expose the others. Reused uploads were shared
+    when they were first stored, so this runs once per file.
+    """
+    permission = {
+        'type': 'anyone',
+        'role': 'reader'
+    }
+    google_request(
+        'drive', 'permissions.create',
+        drive_service.permissions().create(fileId=file_id, body=permission).execute
+    )
+
+def _find_drive_attachment(drive_service, sha256):
+    """Find an original already uploaded to the images folder by content hash"""
+    query = (f"appProperties has {{ key='sha256' and value='{sha256}' }} "
+             f"and '{_get_drive_folder_id(drive_service)}' in parents and trashed=false")
+    results = google_request(
+        'drive', 'files.list',
+        drive_service.files().list(q=query, fields="files(id, webViewLink, appProperties)").execute
+    )
+    for file in results.get('files', []):
+        properties = file.get('appProperties', {})
+        variants = {
+            key[:-len('_file_id')]: value
+            for key, value in properties.items() if key.endswith('_file_id')
         }
-        drive_service.permissions().create(
-            fileId=file.get('id'),
-            body=permission
-        ).execute()
+        _record_attachment(sha256, 'drive', file['id'], file.get('webViewLink', ''), variants, 0)
+        return {'location': file['id'], 'url': file.get('webViewLink', ''), 'variants': variants}
+    return None
+
+def make_image_variants(file_obj):
+    """Re-encode an image as a web-optimized JPEG and a small JPEG thumbnail
+
+    Returns {'web': bytes, 'thumb': bytes}, or {} if the file can't be
+    decoded as an image (the original is still stored as-is).
+    """
+    try:
+        file_obj.seek(0)
+        with Image.open(file_obj) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                # JPEG has no alpha channel: flatten transparency onto white
+                background = Image.new('RGB', image.size, 'white')
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            
+            variants = {}
+            for variant, (max_size, quality) in IMAGE_VARIANTS.items():
+                resized = image.copy()
+                resized.thumbnail((max_size, max_size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+                variants[variant] = buffer.getvalue()
+            return variants
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Could not create image variants: %s", e)
+        return {}
+    finally:
+        file_obj.seek(0)
+
+def image_variant_path(path, variant):
+    """Path of an image variant stored next to the original (shot.png -> shot.web.jpg)"""
+    return f"{os.path.splitext(path)[0]}.{variant}.jpg"
+
+@timed
+def save_image_locally(image_file, ticket_id):
+    """Fallback: Save image locally and return local path
+
+    Images are stored once per content hash (ticket_images/ab/abcd....png),
+    so the same screenshot attached to many tickets takes up space once.
+    """
+    try:
+        sha256 = _hash_file(image_file)
+        known = _find_attachment(sha256, 'local')
+        if known and os.path.exists(known['location']):
+            return known['location']
+        
+        # Create images directory if it doesn't exist
+        images_dir = os.path.join(IMAGES_DIR, sha256[:2])
+        os.makedirs(images_dir, exist_ok=True)
         
-        # Return the web view link
-        return file.get('webViewLink', '')
+        # Save the original via a temporary file so readers never see a partial image
+        file_path = os.path.join(images_dir, sha256 + _attachment_extension(image_file.name))
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(image_file, f)
+        os.replace(tmp_path, file_path)
         
+        # Then the web-optimized version and thumbnail next to it
+        variants = {}
+        for variant, data in make_image_variants(image_file).items():
+            variants[variant] = image_variant_path(file_path, variant)
+            with open(variants[variant], "wb") as f:
+                f.write(data)
+        
+        _record_attachment(sha256, 'local', file_path, f"local://{file_path}", variants, os.path.getsize(file_path))
+        return file_path
     except Exception as e:
-        st.error(f"Error uploading image to Google Drive: {e}")
+        st.error(f"Error saving image locally: {e}")
+        return None
+
+def _hash_file(file_obj):
+    """SHA-256 of a file object's content, read in chunks"""
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(1024 * 1024), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+def _attachment_extension(filename):
+    """Lower-cased extension of an uploaded file name, or '' if it looks unsafe"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,5}", extension) else ''
+
+def _find_attachment(sha256, storage):
+    """Look up a stored attachment by content hash"""
+    row = _local_connection().execute(
+        "SELECT location, url, variants FROM attachments WHERE sha256 = ? AND storage = ?",
+        (sha256, storage)
+    ).fetchone()
+    if row is None:
+        return None
+    return {'location': row[0], 'url': row[1], 'variants': json.loads(row[2])}
+
+def _record_attachment(sha256, storage, location, url, variants, size):
+    """Add a stored attachment to the content-hash catalog"""
+    _local_connection().execute(
+        """
+        INSERT OR REPLACE INTO attachments (sha256, storage, location, url, variants, size, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (sha256, storage, location, url, json.dumps(variants), size, time.time())
+    )
+
+@timed
+def collect_orphan_attachments():
+    """Delete stored attachments no ticket references any more; returns how many were removed
+
+    A mark-and-sweep pass: every Image URL in the ticket stores, the
+    archives and the outbox is live; catalogued attachments older than
+    ATTACHMENT_GC_GRACE that nothing points at are deleted from disk or Drive.
+    If any of them can't be read, nothing is deleted and None is returned.
+    """
+    try:
+        referenced = _referenced_attachment_urls()
+    except Exception as e:
+        _handle_google_error(e)
+        logger.warning("Not removing unused attachments, the tickets could not all be read: %s", e)
+        return None
+    
+    conn = _local_connection()
+    candidates = conn.execute(
+        "SELECT sha256, storage, location, url, variants FROM attachments WHERE created_at < ?",
+        (time.time() - ATTACHMENT_GC_GRACE,)
+    ).fetchall()
+    
+    removed = 0
+    for sha256, storage, location, url, variants in candidates:
+        if url in referenced:
+            continue
+        try:
+            paths = [location] + list(json.loads(variants).values())
+            if storage == 'local':
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                pool = _get_google_client_pool()
+                if pool is None:
+                    continue
+                with _drive_lock():
+                    for file_id in paths:
+                        google_request('drive', 'files.delete', pool['drive_service'].files().delete(fileId=file_id).execute)
+        except Exception as e:
+            logger.warning("Could not delete orphaned attachment %s: %s", sha256, e)
+            continue
+        conn.execute("DELETE FROM attachments WHERE sha256 = ? AND storage = ?", (sha256, storage))
+        removed += 1
+    return removed
+
+def _referenced_attachment_urls():
+    """Every Image URL held anywhere, read straight from the stores (raises on any read error)
+
+    The snapshot and archive readers fall back to the local database or
+    skip partitions they can't read, which is fine for display but would
+    make live attachments look unused, so they aren't used here.
+    """
+    conn = _local_connection()
+    # Local tickets: the sqlite/mirror stores, and tickets saved while Google was unreachable
+    urls = [url for (url,) in conn.execute("SELECT image_url FROM tickets")]
+    urls += [json.loads(payload).get('image_url', '') for (payload,) in conn.execute("SELECT payload FROM outbox")]
+    
+    if os.path.isdir(ARCHIVE_DIR):
+        for name in os.listdir(ARCHIVE_DIR):
+            if not re.fullmatch(r"\d{4}-\d{2}\.db", name):
+                continue
+            archive = sqlite3.connect(os.path.join(ARCHIVE_DIR, name))
+            try:
+                urls += [url for (url,) in archive.execute("SELECT image_url FROM tickets")]
+            finally:
+                archive.close()
+    
+    backend = storage_backend()
+    if backend == 'csv':
+        for ticket_type in TICKET_TYPES:
+            df = CSVTicketStore().load(ticket_type)
+            if 'Image URL' in df.columns:
+                urls += df['Image URL'].astype(str).tolist()
+    
+    pool = _get_google_client_pool()
+    if backend in ('sheets', 'mirror') and pool is not None:
+        # The hot worksheets and their monthly archives
+        pattern = re.compile(rf"({'|'.join(map(re.escape, TICKET_TYPES))}) Tickets( \d{{4}}-\d{{2}})?")
+        spreadsheet = _open_spreadsheet(pool['client'])
+        for worksheet in google_request('sheets_read', 'worksheets', spreadsheet.worksheets):
+            if not pattern.fullmatch(worksheet.title):
+                continue
+            values = google_request('sheets_read', 'get_all_values', worksheet.get_all_values, key=worksheet.id)
+            if values and 'Image URL' in values[0]:
+                col = values[0].index('Image URL')
+                urls += [row[col] for row in values[1:] if len(row) > col]
+    
+    return {str(url).strip() for url in urls}
+
+@st.cache_resource(show_spinner=False)
+def _ticket_row_indexes():
+    """Process-wide {ticket ID: row number} indexes, keyed by ticket type"""
+    return {
+        # ticket type -> {'rows': {ticket ID: row}, 'checked_at'}
+        'indexes': {},
+        'lock': threading.RLock(),
+    }
+
+def _build_row_index(ticket_ids):
+    """Map each ticket ID to its row number; row 1 is the header"""
+    return {
+        str(ticket_id): row
+        for row, ticket_id in enumerate(ticket_ids, start=2)
+        if str(ticket_id)
+    }
+
+def _get_row_index(ticket_type):
+    """Get the row index for ticket type, building it from the ticket snapshot
+
+    The snapshot is read before taking the index lock: a snapshot sync
+    holds the snapshot lock while it replaces the index, so taking the
+    locks the other way round could deadlock.
+    """
+    cache = _ticket_row_indexes()
+    with cache['lock']:
+        index = cache['indexes'].get(ticket_type)
+    if index is not None:
+        return index
+    
+    df = get_tickets(ticket_type)
+    ids = df['Ticket ID'] if not df.empty else []
+    with cache['lock']:
+        # The sync (or another session) may have built it meanwhile
+        index = cache['indexes'].get(ticket_type)
+        if index is None:
+            index = {'rows': _build_row_index(ids), 'checked_at': time.monotonic()}
+            cache['indexes'][ticket_type] = index
+        return index
+
+def _refresh_row_index(ticket_type, worksheet):
+    """Rebuild the row index from the sheet's ticket ID column (one small read)"""
+    cache = _ticket_row_indexes()
+    ticket_ids = google_request('sheets_read', 'col_values', lambda: worksheet.col_values(1), key=worksheet.id)
+    set_ticket_row_index(ticket_type, ticket_ids[1:])
+    with cache['lock']:
+        return cache['indexes'][ticket_type]
+
+@timed
+def lookup_ticket_row(ticket_type, ticket_id, worksheet=None):
+    """Get the row number of a ticket, or None if it doesn't exist
+
+    The index is trusted for TICKET_INDEX_TTL seconds; after that, or when
+    a ticket is missing from it (e.g. submitted by another server process),
+    it is checked against the sheet's ticket ID column.
+    """
+    index = _get_row_index(ticket_type)
+    refreshed = worksheet is not None and time.monotonic() - index['checked_at'] >= TICKET_INDEX_TTL
+    if refreshed:
+        index = _refresh_row_index(ticket_type, worksheet)
+    
+    row_num = index['rows'].get(ticket_id)
+    # Unknown ID: re-read the ID column, but at most once a second
+    if row_num is None and worksheet is not None and time.monotonic() - index['checked_at'] > 1:
+        refreshed = True
+        row_num = _refresh_row_index(ticket_type, worksheet)['rows'].get(ticket_id)
+    record_cache_access('row_index', not refreshed)
+    return row_num
+
+@timed
+def resolve_ticket_rows(ticket_type, ticket_ids, worksheet):
+    """Get {ticket ID: row number} for the tickets that exist, checked against the sheet
+
+    Rows found in the index are confirmed with one batch_get of their
+    ticket ID cells before anything is written to them: another process
+    may have sorted the sheet or deleted rows (e.g. archival) since the
+    index was built. On any mismatch the index is rebuilt from the sheet
+    and the mismatched tickets are looked up again.
+    """
+    rows = {}
+    for ticket_id in ticket_ids:
+        row_num = lookup_ticket_row(ticket_type, ticket_id, worksheet)
+        if row_num is not None:
+            rows[ticket_id] = row_num
+    if not rows:
+        return rows
+
+    ranges = [f"A{row_num}" for row_num in rows.values()]
+    results = google_request('sheets_read', 'batch_get', lambda: worksheet.batch_get(ranges))
+    moved = [
+        ticket_id for ticket_id, values in zip(list(rows), results)
+        if not (values and values[0] and values[0][0] == ticket_id)
+    ]
+    if moved:
+        logger.info("Row index for %s is out of date, rebuilding it", ticket_type)
+        index = _refresh_row_index(ticket_type, worksheet)
+        for ticket_id in moved:
+            row_num = index['rows'].get(ticket_id)
+            if row_num is None:
+                del rows[ticket_id]
+            else:
+                rows[ticket_id] = row_num
+    return rows
+
+def set_ticket_row_index(ticket_type, ticket_ids):
+    """Replace the row index with one built from a freshly read ID column"""
+    cache = _ticket_row_indexes()
+    with cache['lock']:
+        cache['indexes'][ticket_type] = {'rows': _build_row_index(ticket_ids), 'checked_at': time.monotonic()}
+
+def record_ticket_row(ticket_type, ticket_id, row_num):
+    """Add a newly appended ticket to the row index"""
+    cache = _ticket_row_indexes()
+    with cache['lock']:
+        index = cache['indexes'].get(ticket_type)
+        if index is not None:
+            index['rows'][ticket_id] = row_num
+
+def invalidate_ticket_row_index(ticket_type=None):
+    """Forget the row index, e.g. after rows were deleted or reordered"""
+    cache = _ticket_row_indexes()
+    with cache['lock']:
+        if ticket_type is None:
+            cache['indexes'].clear()
+        else:
+            cache['indexes'].pop(ticket_type, None)
+
+def _appended_row_number(response):
+    """Extract the row number from an append_row response ('Sheet'!A5:Q5 -> 5)"""
+    try:
+        updated_range = response['updates']['updatedRange']
+        return a1_to_rowcol(updated_range.split('!')[-1].split(':')[0])[0]
+    except (KeyError, TypeError, IndexError, gspread.exceptions.IncorrectCellLabel):
+        return None
+
+def _ticket_row(ticket_data):
+    """Turn submitted ticket data into a worksheet row (in SHEET_HEADERS order)"""
+    return [
+        ticket_data['ticket_id'],
+        ticket_data['type_of_query'],
+        ticket_data['ss_db_dp_name'],
+        ticket_data['ss_db_dp_code'],
+        ticket_data['city'],
+        ticket_data['state'],
+        ticket_data['incident_category'],
+        ticket_data['subject'],
+        ticket_data['call_received_from'],
+        ticket_data['received_date'],
+        ticket_data['received_time'],
+        ticket_data['status'],
+        ticket_data.get('it_member_assigned', ''),
+        ticket_data.get('closing_date', ''),
+        ticket_data.get('closing_time', ''),
+        ticket_data.get('action_taken', ''),
+        ticket_data.get('image_url', '')
+    ]
+
+def _append_ticket_to_worksheet(worksheet, ticket_data, ticket_type):
+    """Append a ticket row and update the row index and snapshot (raises on error)"""
+    row = _ticket_row(ticket_data)
+    response = google_request('sheets_write', 'append_row', lambda: worksheet.append_row(row), idempotent=False)
+    row_num = _appended_row_number(response)
+    if row_num is not None:
+        record_ticket_row(ticket_type, ticket_data['ticket_id'], row_num)
+    else:
+        invalidate_ticket_row_index(ticket_type)
+    invalidate_ticket_cache(ticket_type)
+
+_LOCAL_INSERT_SQL = (
+    f"INSERT INTO tickets (ticket_type, {', '.join(LOCAL_FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(LOCAL_FIELDS) + 1))})"
+)
+
+@st.cache_resource(show_spinner=False)
+def _local_db(path):
+    """Process-wide handle on the local ticket database (one connection per thread)"""
+    return {
+        'path': path,
+        'threads': threading.local(),
+        'init_lock': threading.Lock(),
+        'initialized': False,
+        # Whether the SQLite build has FTS5 for the search index (see _init_local_fts)
+        'fts': False,
+    }
+
+def _local_connection():
+    """Get this thread's connection to the local ticket database"""
+    db = _local_db(LOCAL_DB_FILE)
+    conn = getattr(db['threads'], 'conn', None)
+    if conn is None:
+        # Autocommit mode; writes that need several statements use explicit transactions
+        conn = sqlite3.connect(db['path'], timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        db['threads'].conn = conn
+    
+    if not db['initialized']:
+        with db['init_lock']:
+            if not db['initialized']:
+                _init_local_db(conn)
+                db['fts'] = _init_local_fts(conn)
+                db['initialized'] = True
+    return conn
+
+def _init_local_db(conn):
+    """Create the local schema and import any tickets from the old CSV files"""
+    columns = ",\n            ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in LOCAL_FIELDS[1:])
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS tickets (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_type TEXT NOT NULL,
+            ticket_id TEXT NOT NULL,
+            {columns}
+        );
+        CREATE INDEX IF NOT EXISTS idx_tickets_type ON tickets (ticket_type, seq);
+        DROP INDEX IF EXISTS idx_tickets_id;
+        CREATE INDEX IF NOT EXISTS idx_tickets_ticket_id ON tickets (ticket_type, ticket_id);
+        CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets (ticket_type, status, seq);
+        CREATE INDEX IF NOT EXISTS idx_tickets_category ON tickets (ticket_type, incident_category, seq);
+        CREATE INDEX IF NOT EXISTS idx_tickets_received ON tickets (ticket_type, received_date, received_time);
+        CREATE TABLE IF NOT EXISTS ticket_sequence (
+            ticket_type TEXT PRIMARY KEY,
+            stamp TEXT NOT NULL,
+            seq INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_type TEXT NOT NULL,
+            ticket_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            image_path TEXT NOT NULL DEFAULT '',
+            image_name TEXT NOT NULL DEFAULT '',
+            image_type TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_until REAL NOT NULL DEFAULT 0,
+            last_error TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS failed_attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_type TEXT NOT NULL,
+            ticket_id TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            image_name TEXT NOT NULL,
+            error TEXT NOT NULL,
+            failed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS attachments (
+            sha256 TEXT NOT NULL,
+            storage TEXT NOT NULL,
+            location TEXT NOT NULL,
+            url TEXT NOT NULL,
+            variants TEXT NOT NULL DEFAULT '{{}}',
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (sha256, storage)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ticket_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_type TEXT NOT NULL,
+            ticket_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            old_value TEXT NOT NULL DEFAULT '',
+            new_value TEXT NOT NULL DEFAULT '',
+            source TEXT NOT NULL,
+            changed_at REAL NOT NULL,
+            synced_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ticket_changes_ticket ON ticket_changes (ticket_type, ticket_id, id);
+        CREATE INDEX IF NOT EXISTS idx_ticket_changes_pending ON ticket_changes (ticket_type) WHERE synced_at IS NULL;
+        CREATE TABLE IF NOT EXISTS mirror_rows (
+            ticket_type TEXT NOT NULL,
+            ticket_id TEXT NOT NULL,
+            row_values TEXT NOT NULL,
+            PRIMARY KEY (ticket_type, ticket_id)
+        );
+    """)
+    
+    for ticket_type in TICKET_TYPES:
+        filename = f"{ticket_type.lower()}_tickets.csv"
+        key = f"imported:{filename}"
+        if not os.path.exists(filename):
+            continue
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            continue
+        
+        df = pd.read_csv(filename, dtype=str, keep_default_na=False)
+        rows = [
+            [ticket_type] + [record.get(field, '') for field in LOCAL_FIELDS]
+            for record in df.to_dict('records')
+        ]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_LOCAL_INSERT_SQL, rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, datetime.now().isoformat()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+# Local columns of SEARCH_FIELDS
+_LOCAL_SEARCH_COLUMNS = [dict(zip(SHEET_HEADERS, LOCAL_FIELDS))[field] for field in SEARCH_FIELDS]
+
+def _local_search_text(row):
+    """SQL expression joining the searchable columns of a row ('new', 'old' or a table name)"""
+    return " || ' ' || ".join(f"{row}.{column}" for column in _LOCAL_SEARCH_COLUMNS)
+
+def _init_local_fts(conn):
+    """Create the full-text search index over the local tickets, returning False without FTS5
+
+    tickets_fts holds the SEARCH_FIELDS text of every row (rowid = seq)
+    and is kept current by triggers, so every write path, including other
+    server processes, the mirror and archival, updates it in the same
+    transaction.
+    """
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(text, tokenize = 'unicode61')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+            INSERT INTO tickets_fts (rowid, text) VALUES (new.seq, {_local_search_text('new')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_update
+        AFTER UPDATE OF {', '.join(_LOCAL_SEARCH_COLUMNS)} ON tickets BEGIN
+            UPDATE tickets_fts SET text = {_local_search_text('new')} WHERE rowid = new.seq;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+            DELETE FROM tickets_fts WHERE rowid = old.seq;
+        END
+        """,
+    ]
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tickets_fts'").fetchone()
+            for statement in statements:
+                conn.execute(statement)
+            if not exists:
+                # Index the tickets stored before the index existed
+                conn.execute(
+                    f"INSERT INTO tickets_fts (rowid, text) SELECT seq, {_local_search_text('tickets')} FROM tickets"
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.OperationalError as e:
+        logger.warning("SQLite full-text search is unavailable, searching in memory instead: %s", e)
+        return False
+    return True
+
+def _local_fts_available():
+    """Whether the local database has the tickets_fts search index"""
+    _local_connection()
+    return _local_db(LOCAL_DB_FILE)['fts']
+
+@timed
+def allocate_ticket_id(ticket_type, now=None):
+    """Allocate a ticket ID that is unique across sessions and server processes
+
+    IDs look like SAP-20250101093000-01: the submission second plus a
+    per-second counter. The counter lives in the local database, so
+    concurrent sessions and every server process sharing that database
+    draw from one sequence. If the clock goes backwards, the last stamp is
+    reused so IDs never repeat. Servers on different machines writing to
+    the same sheet must each set NILONS_NODE_ID.
+    """
+    return allocate_ticket_ids(ticket_type, 1, now)[0]
+
+def allocate_ticket_ids(ticket_type, count, now=None):
+    """Allocate count consecutive ticket IDs in one transaction (see allocate_ticket_id)"""
+    if count <= 0:
+        return []
+    stamp = (now or datetime.now()).strftime('%Y%m%d%H%M%S')
+    
+    conn = _local_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last = conn.execute(
+            "SELECT stamp, seq FROM ticket_sequence WHERE ticket_type = ?", (ticket_type,)
+        ).fetchone()
+        if last is not None and last[0] >= stamp:
+            stamp, seq = last[0], last[1] + 1
+        else:
+            seq = 1
+        conn.execute(
+            """
+            INSERT INTO ticket_sequence (ticket_type, stamp, seq) VALUES (?, ?, ?)
+            ON CONFLICT (ticket_type) DO UPDATE SET stamp = excluded.stamp, seq = excluded.seq
+            """,
+            (ticket_type, stamp, seq + count - 1)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    suffix = f"-{NODE_ID}" if NODE_ID else ""
+    return [f"{ticket_type}-{stamp}-{n:02d}{suffix}" for n in range(seq, seq + count)]
+
+@st.cache_resource(show_spinner=False)
+def _ticket_snapshots():
+    """Process-wide ticket DataFrame snapshots, keyed by ticket type"""
+    return {
+        # ticket type -> {'df', 'loaded_at', 'version', 'headers', 'full_synced_at'}
+        'snapshots': {},
+        # ticket type -> sheet rows written since the last sync
+        'changed_rows': {},
+        'locks': {'SAP': threading.Lock(), 'Botree': threading.Lock()},
+        'lock': threading.Lock(),
+        'version': 0,
+    }
+
+def invalidate_ticket_cache(ticket_type=None, changed_rows=()):
+    """Mark the cached ticket snapshot as stale so the next read syncs it
+
+    changed_rows are sheet rows this process has just rewritten; the next
+    incremental sync re-reads them along with any newly appended rows.
+    """
+    cache = _ticket_snapshots()
+    with cache['lock']:
+        ticket_types = list(cache['snapshots']) if ticket_type is None else [ticket_type]
+        for name in ticket_types:
+            snapshot = cache['snapshots'].get(name)
+            if snapshot is not None:
+                cache['snapshots'][name] = dict(snapshot, loaded_at=float('-inf'))
+        if ticket_type is not None and changed_rows:
+            cache['changed_rows'].setdefault(ticket_type, set()).update(changed_rows)
+
+def reset_ticket_cache(ticket_type=None):
+    """Drop the cached ticket snapshot so the next read does a full fetch"""
+    cache = _ticket_snapshots()
+    with cache['lock']:
+        if ticket_type is None:
+            cache['snapshots'].clear()
+            cache['changed_rows'].clear()
+        else:
+            cache['snapshots'].pop(ticket_type, None)
+            cache['changed_rows'].pop(ticket_type, None)
+
+def _snapshot_lock(cache, ticket_type):
+    """Per-ticket-type lock so only one session refreshes a snapshot at a time"""
+    with cache['lock']:
+        return cache['locks'].setdefault(ticket_type, threading.Lock())
+
+@timed
+def get_ticket_snapshot(ticket_type):
+    """Get the cached ticket snapshot for ticket type as {'df', 'loaded_at', 'version', ...}
+
+    Snapshots are shared by every session, so callers must treat the
+    DataFrame as read-only.
+    """
+    cache = _ticket_snapshots()
+    
+    snapshot = cache['snapshots'].get(ticket_type)
+    if snapshot and time.monotonic() - snapshot['loaded_at'] < TICKET_CACHE_TTL:
+        record_cache_access('ticket_snapshot', True)
+        return snapshot
+    record_cache_access('ticket_snapshot', False)
+    
+    with _snapshot_lock(cache, ticket_type):
+        # Another session may have refreshed it while we were waiting
+        snapshot = cache['snapshots'].get(ticket_type)
+        if snapshot and time.monotonic() - snapshot['loaded_at'] < TICKET_CACHE_TTL:
+            return snapshot
+        
+        with cache['lock']:
+            changed_rows = cache['changed_rows'].pop(ticket_type, set())
+        
+        result = _sync_tickets(ticket_type, snapshot, changed_rows)
+        if result is None:
+            # Couldn't reach Google: keep the rows to re-read next time, and
+            # don't cache the fallback so the next read retries
+            with cache['lock']:
+                cache['changed_rows'].setdefault(ticket_type, set()).update(changed_rows)
+            return {
+                'df': SQLiteTicketStore().load(ticket_type),
+                'loaded_at': time.monotonic(),
+                'version': 0,
+                'headers': list(SHEET_HEADERS),
+                'full_synced_at': time.monotonic(),
+            }
+        
+        df, headers, full = result
+        now = time.monotonic()
+        if snapshot is None or df is not snapshot['df']:
+            store = get_ticket_store()
+            if full:
+                store.index_snapshot(ticket_type, df)
+            else:
+                # Only appended rows and rows we rewrote can differ
+                old_len = len(snapshot['df'])
+                positions = [row - 2 for row in changed_rows if 0 <= row - 2 < old_len]
+                store.index_snapshot(ticket_type, df, positions + list(range(old_len, len(df))))
+        with cache['lock']:
+            version = snapshot['version'] if snapshot else 0
+            if snapshot is None or df is not snapshot['df']:
+                cache['version'] += 1
+                version = cache['version']
+            snapshot = {
+                'df': df,
+                'loaded_at': now,
+                'version': version,
+                'headers': headers,
+                'full_synced_at': now if full else snapshot['full_synced_at'],
+            }
+            cache['snapshots'][ticket_type] = snapshot
+        return snapshot
+
+def get_tickets(ticket_type):
+    """Get all tickets from the configured store (served from a short-lived shared snapshot)"""
+    return get_ticket_snapshot(ticket_type)['df']
+
+@timed
+def _sync_tickets(ticket_type, snapshot, changed_rows):
+    """Bring a ticket snapshot up to date, returning (df, headers, full) or None on error
+
+    While the previous snapshot came from Google Sheets and is younger than
+    FULL_SYNC_INTERVAL, only the rows appended since then and the rows
+    known to have changed are fetched. A full fetch happens on that
+    schedule, or when rows have been deleted or moved. Other stores are
+    always read in full.
+    """
+    store = get_ticket_store()
+    if store.name != 'sheets':
+        df = store.load(ticket_type)
+        if snapshot is not None and df.equals(snapshot['df']):
+            # Unchanged: keep the old frame so the version (and memoized results) stay valid
+            df = snapshot['df']
+        return df, [c for c in df.columns if c not in TICKET_TIMESTAMP_COLUMNS] or list(SHEET_HEADERS), True
+
+    client, drive_service = get_google_sheets_client()
+    worksheet = get_or_create_worksheet(client, ticket_type)
+    if not worksheet:
+        # Google is unreachable: the caller serves the local database uncached
+        return None
+    
+    try:
+        incremental = (
+            snapshot is not None
+            and snapshot['headers'][:1] == ["Ticket ID"]
+            and time.monotonic() - snapshot['full_synced_at'] < FULL_SYNC_INTERVAL
+        )
+        if incremental:
+            df = _fetch_ticket_changes(ticket_type, worksheet, snapshot['df'], snapshot['headers'], changed_rows)
+            if df is not None:
+                return df, snapshot['headers'], False
+        
+        df, headers = _fetch_all_tickets(ticket_type, worksheet)
+        return df, headers, True
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error reading from Google Sheets: {e}")
+        return None
+
+def _rows_to_frame(rows, headers):
+    """Build a typed ticket DataFrame from raw sheet rows, padding short rows"""
+    width = len(headers)
+    return apply_ticket_schema(pd.DataFrame(
+        [(row + [''] * (width - len(row)))[:width] for row in rows],
+        columns=headers
+    ))
+
+@timed
+def apply_ticket_schema(df):
+    """Convert a ticket DataFrame with sheet column names to the shared typed layout
+
+    TICKET_CATEGORY_COLUMNS become categoricals and TICKET_TIMESTAMP_COLUMNS
+    are added as datetime64 columns (NaT where empty or unparseable). The
+    original string columns are kept for display and for writing back.
+    """
+    df = df.copy()
+    for column in TICKET_CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna('').astype(str).astype('category')
+    for column, (date_column, time_column) in TICKET_TIMESTAMP_COLUMNS.items():
+        if date_column in df.columns and time_column in df.columns:
+            df[column] = _ticket_timestamps(df[date_column], df[time_column])
+    return df
+
+def _ticket_timestamps(dates, times):
+    """Combine date and time string columns into datetime64, NaT where unparseable"""
+    dates = dates.fillna('').astype(str).str.strip()
+    combined = dates + ' ' + times.fillna('').astype(str).str.strip()
+    parsed = pd.to_datetime(combined, format="%Y-%m-%d %H:%M:%S", errors='coerce')
+    
+    # Sheets may have re-formatted dates it recognised; parse those the slow way
+    retry = parsed.isna() & dates.ne('')
+    if retry.any():
+        parsed[retry] = pd.to_datetime(combined[retry], format='mixed', errors='coerce')
+    return parsed
+
+def _align_categories(frames):
+    """Give each categorical column the same categories in every frame
+
+    pandas only keeps a categorical dtype through concat and row
+    assignment when the categories match.
+    """
+    frames = list(frames)
+    for column in TICKET_CATEGORY_COLUMNS:
+        if not all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            continue
+        categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)))
+        for frame in frames:
+            if list(frame[column].cat.categories) != categories:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return frames
+
+def concat_tickets(frames):
+    """Concatenate typed ticket DataFrames, keeping categorical columns categorical"""
+    frames = _align_categories([frame.copy() for frame in frames])
+    return pd.concat(frames, ignore_index=True)
+
+@timed
+def _fetch_all_tickets(ticket_type, worksheet):
+    """Read the whole worksheet, returning (df, headers)"""
+    values = google_request('sheets_read', 'get_all_values', worksheet.get_all_values, key=worksheet.id)
+    headers = values[0] if values else list(SHEET_HEADERS)
+    df = _rows_to_frame(values[1:], headers)
+    set_ticket_row_index(ticket_type, df['Ticket ID'] if 'Ticket ID' in df.columns else [])
+    return df, headers
+
+@timed
+def _fetch_ticket_changes(ticket_type, worksheet, df, headers, changed_rows):
+    """Merge newly appended and changed rows into df, or return None if rows moved
+
+    One batch_get reads the range from the last known row to the end of
+    the sheet plus each changed row. If the last known row no longer holds
+    the same ticket, rows were deleted or reordered and a full fetch is needed.
+    """
+    last_row = len(df) + 1  # row 1 is the header
+    last_col = rowcol_to_a1(1, len(headers))[:-1]
+    changed = sorted(row for row in changed_rows if 2 <= row < last_row)
+    
+    ranges = [f"A{last_row}:{last_col}"] + [f"A{row}:{last_col}{row}" for row in changed]
+    results = google_request(
+        'sheets_read', 'batch_get', lambda: worksheet.batch_get(ranges), key=(worksheet.id, tuple(ranges))
+    )
+    
+    tail = list(results[0])
+    expected = str(df['Ticket ID'].iloc[-1]) if len(df) else headers[0]
+    if not tail or not tail[0] or tail[0][0] != expected:
+        return None
+    
+    new_rows = tail[1:]
+    updates = {row: values[0] for row, values in zip(changed, results[1:]) if values}
+    if not new_rows and not updates:
+        return df
+    
+    merged = df
+    if updates:
+        merged, update_frame = _align_categories([df.copy(), _rows_to_frame(list(updates.values()), headers)])
+        positions = [row - 2 for row in updates]
+        for column in merged.columns:
+            merged.iloc[positions, merged.columns.get_loc(column)] = update_frame[column].values
+    if new_rows:
+        merged = concat_tickets([merged, _rows_to_frame(new_rows, headers)])
+        for offset, row in enumerate(new_rows):
+            if row:
+                record_ticket_row(ticket_type, row[0], last_row + 1 + offset)
+    return merged
+
+@st.cache_resource(show_spinner=False)
+def _search_indexes():
+    """Process-wide inverted indexes over SEARCH_FIELDS, keyed by ticket type"""
+    return {
+        # ticket type -> {'postings': {token: {ticket IDs}}, 'docs': {ticket ID: (text, tokens)}, 'vocabulary': sorted tokens or None}
+        # ("SAP archive" etc. index the archived tickets)
+        'indexes': {},
+        # archive index key -> archive_version() it was built from
+        'archive_versions': {},
+        'lock': threading.Lock(),
+    }
+
+def _search_tokens(text):
+    """Lower-case words and numbers in text"""
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+def _search_texts(df):
+    """The searchable text of each ticket row, as one lower-case string"""
+    fields = [f for f in SEARCH_FIELDS if f in df.columns]
+    if not fields or df.empty:
+        return pd.Series([''] * len(df), index=df.index, dtype=object)
+    columns = [df[f].astype(str) for f in fields]
+    return columns[0].str.cat(columns[1:], sep=' ').str.lower()
+
+def search_index_built(ticket_type):
+    """Whether the in-memory search index for ticket type exists yet"""
+    search = _search_indexes()
+    with search['lock']:
+        return ticket_type in search['indexes']
+
+@timed
+def update_search_index(ticket_type, df, positions=None):
+    """Bring the search index for ticket type in line with a ticket snapshot
+
+    With positions, only those rows of df are (re)indexed. Without, every
+    row is compared to what is indexed and only new or changed tickets are
+    re-tokenized; tickets no longer in df are dropped.
+    """
+    if 'Ticket ID' not in df.columns:
+        return
+    
+    rows = df if positions is None else df.iloc[sorted(set(positions))]
+    ticket_ids = rows['Ticket ID'].astype(str).tolist()
+    texts = _search_texts(rows).tolist()
+    
+    search = _search_indexes()
+    with search['lock']:
+        index = search['indexes'].setdefault(ticket_type, {'postings': {}, 'docs': {}, 'vocabulary': None})
+        postings, docs = index['postings'], index['docs']
+        
+        def remove(ticket_id):
+            _, tokens = docs.pop(ticket_id)
+            for token in tokens:
+                ids = postings.get(token)
+                if ids is not None:
+                    ids.discard(ticket_id)
+                    if not ids:
+                        del postings[token]
+                        index['vocabulary'] = None
+        
+        for ticket_id, text in zip(ticket_ids, texts):
+            indexed = docs.get(ticket_id)
+            if indexed is not None and indexed[0] == text:
+                continue
+            if indexed is not None:
+                remove(ticket_id)
+            tokens = _search_tokens(text)
+            docs[ticket_id] = (text, tokens)
+            for token in tokens:
+                if token not in postings:
+                    postings[token] = set()
+                    index['vocabulary'] = None
+                postings[token].add(ticket_id)
+        
+        if positions is None:
+            for ticket_id in set(docs) - set(ticket_ids):
+                remove(ticket_id)
+
+@timed
+def search_tickets(query, ticket_types=None, include_archived=False):
+    """Find tickets matching every word of query, as {ticket type: {ticket IDs}}
+
+    Words match as prefixes, so "ora" finds "ORA-01555" and "pune" finds "Pune".
+    With include_archived, archived tickets are searched too (through a
+    separate index, refreshed whenever the archive cache changes).
+    """
+    terms = _search_tokens(query)
+    store = get_ticket_store()
+    results = {}
+    for ticket_type in ticket_types or TICKET_TYPES:
+        results[ticket_type] = store.search(ticket_type, terms) if terms else set()
+        if include_archived and terms:
+            results[ticket_type] |= _search_index(_sync_archive_search_index(ticket_type), terms)
+    return results
+
+def _sync_archive_search_index(ticket_type):
+    """Bring the index over archived tickets of a type up to date, returning its key"""
+    key = f"{ticket_type} archive"
+    search = _search_indexes()
+    version = archive_version()
+    if search['archive_versions'].get(key) != version:
+        archived = get_archived_tickets(ticket_type)
+        update_search_index(key, archived if not archived.empty else pd.DataFrame(columns=["Ticket ID"]))
+        # Reading the archive may have refreshed its cache; record the version it now has
+        with search['lock']:
+            search['archive_versions'][key] = archive_version()
+    return key
+
+def _search_index(ticket_type, terms):
+    """Ticket IDs whose indexed text has a word starting with each term"""
+    search = _search_indexes()
+    with search['lock']:
+        index = search['indexes'].get(ticket_type)
+        if index is None:
+            return set()
+        if index['vocabulary'] is None:
+            index['vocabulary'] = sorted(index['postings'])
+        vocabulary, postings = index['vocabulary'], index['postings']
+        
+        matches = None
+        # Rarest-looking (longest) terms first so the intersection shrinks quickly
+        for term in sorted(terms, key=len, reverse=True):
+            ids = set()
+            position = bisect.bisect_left(vocabulary, term)
+            while position < len(vocabulary) and vocabulary[position].startswith(term):
+                ids |= postings[vocabulary[position]]
+                position += 1
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                break
+        return matches or set()
+
+def _query_snapshot(df, filters, sort_by, descending, limit, offset, columns):
+    """query_tickets over an in-memory ticket DataFrame"""
+    if df.empty:
+        return df, 0
+    
+    mask = pd.Series(True, index=df.index)
+    if filters['status']:
+        mask &= df['Status'] == filters['status']
+    if filters['category']:
+        mask &= df['Incident Category'] == filters['category']
+    if filters['assigned_to']:
+        mask &= df['IT Member Assigned'] == filters['assigned_to']
+    if filters['received_from'] is not None:
+        mask &= df['Received At'] >= pd.Timestamp(filters['received_from'])
+    if filters['received_to'] is not None:
+        mask &= df['Received At'] < pd.Timestamp(filters['received_to']) + pd.Timedelta(days=1)
+    if filters['ticket_ids'] is not None:
+        mask &= df['Ticket ID'].astype(str).isin(filters['ticket_ids'])
+    
+    matches = df[mask]
+    if sort_by:
+        matches = matches.sort_values(sort_by, ascending=not descending, kind='stable')
+    
+    stop = None if limit is None else offset + limit
+    page = matches.iloc[offset:stop]
+    if columns is not None:
+        page = page[[c for c in columns if c in page.columns]]
+    return page, len(matches)
+
+# Sheet column -> local columns it is read from (timestamps need both parts)
+_LOCAL_COLUMNS = dict(zip(SHEET_HEADERS, ([field] for field in LOCAL_FIELDS)))
+_LOCAL_COLUMNS.update({
+    column: [LOCAL_FIELDS[SHEET_HEADERS.index(part)] for part in parts]
+    for column, parts in TICKET_TIMESTAMP_COLUMNS.items()
+})
+
+def _query_local_tickets(ticket_type, filters, sort_by, descending, limit, offset, columns):
+    """query_tickets as a single SQL query on the local ticket database"""
+    where = ["ticket_type = ?"]
+    params = [ticket_type]
+    if filters['status']:
+        where.append("status = ?")
+        params.append(filters['status'])
+    if filters['category']:
+        where.append("incident_category = ?")
+        params.append(filters['category'])
+    if filters['assigned_to']:
+        where.append("it_member_assigned = ?")
+        params.append(filters['assigned_to'])
+    if filters['received_from'] is not None:
+        where.append("received_date >= ?")
+        params.append(pd.Timestamp(filters['received_from']).strftime("%Y-%m-%d"))
+    if filters['received_to'] is not None:
+        where.append("received_date <= ?")
+        params.append(pd.Timestamp(filters['received_to']).strftime("%Y-%m-%d"))
+    if filters['ticket_ids'] is not None:
+        ticket_ids = list(filters['ticket_ids'])
+        if not ticket_ids:
+            return pd.DataFrame(columns=columns or SHEET_HEADERS), 0
+        where.append("ticket_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(ticket_ids))
+    
+    order = [f"{field} {'DESC' if descending else 'ASC'}" for field in _LOCAL_COLUMNS.get(sort_by, [])]
+    order.append(f"seq {'DESC' if descending and sort_by else 'ASC'}")
+    
+    wanted = columns if columns is not None else SHEET_HEADERS
+    fields = list(dict.fromkeys(field for column in wanted for field in _LOCAL_COLUMNS.get(column, [])))
+    
+    conn = _local_connection()
+    where_sql = " AND ".join(where)
+    total = conn.execute(f"SELECT COUNT(*) FROM tickets WHERE {where_sql}", params).fetchone()[0]
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(fields) or 'ticket_id'} FROM tickets WHERE {where_sql} "
+        f"ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+        conn,
+        params=params + [-1 if limit is None else limit, offset]
+    )
+    df = apply_ticket_schema(df.rename(columns=dict(zip(LOCAL_FIELDS, SHEET_HEADERS))))
+    return df[[c for c in wanted if c in df.columns]], total
+
+def _update_row_fields(worksheet, headers, row_nums, fields):
+    """Write the same columns of several rows in a single batch_update request"""
+    data = [entry for row_num in row_nums for entry in _row_update_ranges(headers, row_num, fields)]
+    google_request('sheets_write', 'batch_update', lambda: worksheet.batch_update(data, value_input_option='USER_ENTERED'))
+
+def _row_update_ranges(headers, row_num, fields):
+    """batch_update entries writing {column: value} into one sheet row
+
+    Adjacent columns are merged into one range, so with the standard
+    layout the closing fields go out as one contiguous range.
+    """
+    cols = sorted((headers.index(name) + 1, value) for name, value in fields.items())
+    
+    # Group adjacent columns into contiguous runs
+    runs = []
+    for col, value in cols:
+        if runs and runs[-1][0] + len(runs[-1][1]) == col:
+            runs[-1][1].append(value)
+        else:
+            runs.append((col, [value]))
+    
+    return [
+        {
+            'range': f"{rowcol_to_a1(row_num, col)}:{rowcol_to_a1(row_num, col + len(values) - 1)}",
+            'values': [values],
+        }
+        for col, values in runs
+    ]
+
+class TicketStore:
+    """Interface shared by the ticket storage backends (see TICKET_STORES)
+
+    Tickets go in as the dicts the submit form builds (LOCAL_FIELDS keys)
+    and come out as typed DataFrames with the sheet column names, whichever
+    backend holds them; updates name columns the same way, e.g.
+    {"Status": "Closed"}. Methods raise on storage errors.
+    """
+    name = None
+    
+    def append(self, ticket_type, ticket_data):
+        """Store one new ticket"""
+        self.append_many(ticket_type, [ticket_data])
+    
+    def append_many(self, ticket_type, tickets):
+        """Store several new tickets in as few writes as the backend allows"""
+        raise NotImplementedError
+    
+    def load(self, ticket_type):
+        """Read every ticket of a type"""
+        raise NotImplementedError
+    
+    def get(self, ticket_type, ticket_id):
+        """Get a single ticket as a Series, or None if it doesn't exist"""
+        df, _ = self.query(ticket_type, ticket_ids=[ticket_id], limit=1)
+        return df.iloc[0] if not df.empty else None
+    
+    def query(self, ticket_type, status=None, category=None, assigned_to=None,
+              received_from=None, received_to=None, ticket_ids=None,
+              sort_by=None, descending=False, limit=None, offset=0, columns=None):
+        """Get one page of matching tickets as (df, total matching count); see query_tickets"""
+        filters = {
+            'status': status,
+            'category': category,
+            'assigned_to': assigned_to,
+            'received_from': received_from,
+            'received_to': received_to,
+            'ticket_ids': ticket_ids,
+        }
+        return self._query(ticket_type, filters, sort_by, descending, limit, offset, columns)
+    
+    def _query(self, ticket_type, filters, sort_by, descending, limit, offset, columns):
+        """Filter the shared snapshot (stores without a query engine)"""
+        return _query_snapshot(get_tickets(ticket_type), filters, sort_by, descending, limit, offset, columns)
+    
+    def status_counts(self, ticket_type):
+        """Number of tickets per status, e.g. {'Open': 12, 'Closed': 30}"""
+        df = get_tickets(ticket_type)
+        if 'Status' not in df.columns:
+            return {}
+        counts = df['Status'].value_counts()
+        return {str(status): int(count) for status, count in counts.items() if count}
+    
+    def update_many(self, ticket_type, ticket_ids, fields):
+        """Set the same columns on several tickets, returning how many were found"""
+        raise NotImplementedError
+    
+    def search(self, ticket_type, terms):
+        """Ticket IDs with a word starting with each of terms (see search_tickets)"""
+        # Make sure the in-memory index has caught up with the store
+        get_ticket_snapshot(ticket_type)
+        return _search_index(ticket_type, terms)
+    
+    def index_snapshot(self, ticket_type, df, positions=None):
+        """Bring the in-memory search index in line with a freshly synced snapshot"""
+        update_search_index(ticket_type, df, positions)
+    
+    def close(self, ticket_type, ticket_id, it_member, action_taken):
+        """Close one ticket, returning False if it doesn't exist"""
+        return self.close_many(ticket_type, [ticket_id], it_member, action_taken) > 0
+    
+    def close_many(self, ticket_type, ticket_ids, it_member, action_taken):
+        """Close several tickets with the same action taken, returning how many were found"""
+        now = datetime.now()
+        return self.update_many(ticket_type, ticket_ids, {
+            "Status": "Closed",
+            "IT Member Assigned": it_member,
+            "Closing Date": now.strftime("%Y-%m-%d"),
+            "Closing Time": now.strftime("%H:%M:%S"),
+            "Action Taken": action_taken,
+        })
+    
+    def assign_many(self, ticket_type, ticket_ids, it_member):
+        """Reassign several tickets to one IT member, returning how many were found"""
+        return self.update_many(ticket_type, ticket_ids, {"IT Member Assigned": it_member})
+
+class SheetsTicketStore(TicketStore):
+    """Tickets in the "SAP Tickets"/"Botree Tickets" worksheets
+
+    Reads come from the shared snapshot, kept in sync incrementally. If
+    the worksheet can't be reached, single tickets and updates go to the
+    local database; bulk appends fail.
+    """
+    name = 'sheets'
+    
+    def _worksheet(self, ticket_type):
+        """(client, worksheet) for ticket type; the worksheet is None when Google is unreachable"""
+        client, drive_service = get_google_sheets_client()
+        return client, get_or_create_worksheet(client, ticket_type)
+    
+    @timed
+    def append(self, ticket_type, ticket_data):
+        client, worksheet = self._worksheet(ticket_type)
+        if not worksheet:
+            SQLiteTicketStore().append(ticket_type, ticket_data)
+            invalidate_ticket_row_index(ticket_type)
+            return
+        _append_ticket_to_worksheet(worksheet, ticket_data, ticket_type)
+    
+    @timed
+    def append_many(self, ticket_type, tickets):
+        """Append the tickets in chunks of SHEETS_APPEND_CHUNK rows, one request per chunk
+
+        Unlike single submissions, bulk appends don't fall back to the
+        local database: nothing would bring those tickets back to the
+        sheet, so an unreachable worksheet raises instead.
+        """
+        client, worksheet = self._worksheet(ticket_type)
+        if not worksheet:
+            raise RuntimeError(f"Google Sheets is unreachable, no {ticket_type} tickets were saved")
+        
+        rows = [_ticket_row(ticket_data) for ticket_data in tickets]
+        for start in range(0, len(rows), SHEETS_APPEND_CHUNK):
+            chunk = rows[start:start + SHEETS_APPEND_CHUNK]
+            response = google_request(
+                'sheets_write', 'append_rows', lambda: worksheet.append_rows(chunk), idempotent=False
+            )
+            first_row = _appended_row_number(response)
+            if first_row is None:
+                invalidate_ticket_row_index(ticket_type)
+                continue
+            for offset, row in enumerate(chunk):
+                record_ticket_row(ticket_type, row[0], first_row + offset)
+        invalidate_ticket_cache(ticket_type)
+    
+    def load(self, ticket_type):
+        return get_tickets(ticket_type)
+    
+    def get(self, ticket_type, ticket_id):
+        df = get_tickets(ticket_type)
+        if df.empty:
+            return None
+        
+        row_num = lookup_ticket_row(ticket_type, ticket_id)
+        if row_num is not None and row_num - 2 < len(df):
+            ticket = df.iloc[row_num - 2]
+            if str(ticket['Ticket ID']) == ticket_id:
+                return ticket
+        
+        # The snapshot and the index disagree (one of them is older); scan the snapshot
+        matches = df[df['Ticket ID'].astype(str) == ticket_id]
+        return matches.iloc[0] if not matches.empty else None
+    
+    @timed
+    def update_many(self, ticket_type, ticket_ids, fields):
+        """Look the rows up in the row index, confirm them, and write them all in one batch_update"""
+        client, worksheet = self._worksheet(ticket_type)
+        if not worksheet:
+            return SQLiteTicketStore().update_many(ticket_type, ticket_ids, fields)
+
+        rows = sorted(set(resolve_ticket_rows(ticket_type, ticket_ids, worksheet).values()))
+        if rows:
+            headers = get_worksheet_headers(client, ticket_type)
+            _update_row_fields(worksheet, headers, rows, fields)
+            invalidate_ticket_cache(ticket_type, changed_rows=rows)
+        return len(rows)
+
+class SQLiteTicketStore(TicketStore):
+    """Tickets in the local SQLite database, filtered and sorted with indexed SQL"""
+    name = 'sqlite'
+    
+    @timed
+    def append_many(self, ticket_type, tickets):
+        rows = [
+            [ticket_type] + [str(ticket_data.get(field, '') or '') for field in LOCAL_FIELDS]
+            for ticket_data in tickets
+        ]
+        conn = _local_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_LOCAL_INSERT_SQL, rows)
+            self._log_inserts(conn, ticket_type, [row[1] for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        invalidate_ticket_cache(ticket_type)
+    
+    def _log_inserts(self, conn, ticket_type, ticket_ids):
+        """Hook for stores that keep a change log (called inside the write transaction)"""
+    
+    def _log_updates(self, conn, ticket_type, ticket_ids, fields):
+        """Hook for stores that keep a change log (called inside the write transaction, before the update)"""
+    
+    @timed
+    def load(self, ticket_type):
+        conn = _local_connection()
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(LOCAL_FIELDS)} FROM tickets WHERE ticket_type = ? ORDER BY seq",
+            conn,
+            params=(ticket_type,)
+        )
+        if df.empty:
+            return pd.DataFrame()
+        return apply_ticket_schema(df.rename(columns=dict(zip(LOCAL_FIELDS, SHEET_HEADERS))))
+    
+    def _query(self, ticket_type, filters, sort_by, descending, limit, offset, columns):
+        return _query_local_tickets(ticket_type, filters, sort_by, descending, limit, offset, columns)
+    
+    def status_counts(self, ticket_type):
+        rows = _local_connection().execute(
+            "SELECT status, COUNT(*) FROM tickets WHERE ticket_type = ? GROUP BY status",
+            (ticket_type,)
+        ).fetchall()
+        return dict(rows)
+    
+    @timed
+    def search(self, ticket_type, terms):
+        """Prefix query against tickets_fts, which triggers keep current on every write"""
+        if not _local_fts_available():
+            return super().search(ticket_type, terms)
+        rows = _local_connection().execute(
+            """
+            SELECT ticket_id FROM tickets
+            WHERE seq IN (SELECT rowid FROM tickets_fts WHERE tickets_fts MATCH ?) AND ticket_type = ?
+            """,
+            (" AND ".join(f'"{term}"*' for term in terms), ticket_type)
+        )
+        return {ticket_id for (ticket_id,) in rows}
+    
+    def index_snapshot(self, ticket_type, df, positions=None):
+        if not _local_fts_available():
+            super().index_snapshot(ticket_type, df, positions)
+    
+    @timed
+    def update_many(self, ticket_type, ticket_ids, fields):
+        """One UPDATE statement, in place"""
+        columns = dict(zip(SHEET_HEADERS, LOCAL_FIELDS))
+        assignments = ", ".join(f"{columns[name]} = ?" for name in fields)
+        conn = _local_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._log_updates(conn, ticket_type, ticket_ids, fields)
+            cursor = conn.execute(
+                f"""
+                UPDATE tickets SET {assignments}
+                WHERE ticket_type = ? AND ticket_id IN (SELECT value FROM json_each(?))
+                """,
+                list(fields.values()) + [ticket_type, json.dumps(list(ticket_ids))]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        invalidate_ticket_cache(ticket_type)
+        return cursor.rowcount
+
+@st.cache_resource(show_spinner=False)
+def _csv_store_lock():
+    """Process-wide lock serializing access to the CSV ticket files"""
+    return threading.Lock()
+
+class CSVTicketStore(TicketStore):
+    """Tickets in one CSV file per type under CSV_DIR, with the worksheet's header row
+
+    For small single-server installs: appends add lines to the file, every
+    update rewrites it, and reads go through the shared snapshot.
+    """
+    name = 'csv'
+    
+    def _path(self, ticket_type):
+        return os.path.join(CSV_DIR, f"{ticket_type.lower()}_tickets.csv")
+    
+    @timed
+    def append_many(self, ticket_type, tickets):
+        path = self._path(ticket_type)
+        with _csv_store_lock():
+            os.makedirs(CSV_DIR, exist_ok=True)
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(SHEET_HEADERS)
+                writer.writerows(_ticket_row(ticket_data) for ticket_data in tickets)
+        invalidate_ticket_cache(ticket_type)
+        self._index_rows(ticket_type, pd.DataFrame([_ticket_row(t) for t in tickets], columns=SHEET_HEADERS))
+    
+    @timed
+    def load(self, ticket_type):
+        path = self._path(ticket_type)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        with _csv_store_lock():
+            df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        return apply_ticket_schema(df)
+    
+    @timed
+    def update_many(self, ticket_type, ticket_ids, fields):
+        path = self._path(ticket_type)
+        if not os.path.exists(path):
+            return 0
+        
+        with _csv_store_lock():
+            df = pd.read_csv(path, dtype=str, keep_default_na=False)
+            matches = df['Ticket ID'].isin(set(ticket_ids))
+            for column, value in fields.items():
+                df.loc[matches, column] = value
+            # Write a new file and swap it in, so a crash can't leave half a file
+            df.to_csv(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+        invalidate_ticket_cache(ticket_type)
+        self._index_rows(ticket_type, df[matches])
+        return int(matches.sum())
+    
+    def search(self, ticket_type, terms):
+        if not search_index_built(ticket_type):
+            return super().search(ticket_type, terms)
+        return _search_index(ticket_type, terms)
+    
+    def index_snapshot(self, ticket_type, df, positions=None):
+        # Built once from the file; after that the writes above keep it current
+        if not search_index_built(ticket_type):
+            update_search_index(ticket_type, df)
+    
+    def _index_rows(self, ticket_type, df):
+        """Add just-written rows to the search index (once it has been built)"""
+        if search_index_built(ticket_type) and not df.empty:
+            update_search_index(ticket_type, df, range(len(df)))
+
+class MirroredTicketStore(SQLiteTicketStore):
+    """The SQLite store, kept in sync with the Google worksheets in the background
+
+    Reads and writes only touch the local database, so they never wait on
+    Google. Every write is also recorded in the ticket_changes log, which
+    sync_ticket_mirror pushes to the sheet.
+    """
+    name = 'mirror'
+    
+    def append_many(self, ticket_type, tickets):
+        super().append_many(ticket_type, tickets)
+        _outbox_worker()['wake'].set()
+    
+    def update_many(self, ticket_type, ticket_ids, fields):
+        updated = super().update_many(ticket_type, ticket_ids, fields)
+        _outbox_worker()['wake'].set()
+        return updated
+    
+    def _log_inserts(self, conn, ticket_type, ticket_ids):
+        now = time.time()
+        conn.executemany(
+            """
+            INSERT INTO ticket_changes (ticket_type, ticket_id, field, source, changed_at)
+            VALUES (?, ?, '', 'local', ?)
+            """,
+            [(ticket_type, ticket_id, now) for ticket_id in ticket_ids]
+        )
+    
+    def _log_updates(self, conn, ticket_type, ticket_ids, fields):
+        columns = dict(zip(SHEET_HEADERS, LOCAL_FIELDS))
+        rows = conn.execute(
+            f"""
+            SELECT ticket_id, {', '.join(columns[name] for name in fields)} FROM tickets
+            WHERE ticket_type = ? AND ticket_id IN (SELECT value FROM json_each(?))
+            """,
+            (ticket_type, json.dumps(list(ticket_ids)))
+        ).fetchall()
+        now = time.time()
+        conn.executemany(
+            """
+            INSERT INTO ticket_changes (ticket_type, ticket_id, field, old_value, new_value, source, changed_at)
+            VALUES (?, ?, ?, ?, ?, 'local', ?)
+            """,
+            [
+                (ticket_type, row[0], name, old_value, str(value), now)
+                for row in rows
+                for (name, value), old_value in zip(fields.items(), row[1:])
+                if old_value != str(value)
+            ]
+        )
+
+# NILONS_STORAGE_BACKEND value -> ticket store
+TICKET_STORES = {
+    'sheets': SheetsTicketStore,
+    'sqlite': SQLiteTicketStore,
+    'mirror': MirroredTicketStore,
+    'csv': CSVTicketStore,
+}
+
+def storage_backend():
+    """Name of the ticket store in use
+
+    STORAGE_BACKEND picks it; Google Sheets (also the default) needs
+    credentials.json and falls back to SQLite without it, or when it can't
+    be loaded (reported once per session).
+    """
+    if STORAGE_BACKEND not in ('', 'sheets'):
+        return STORAGE_BACKEND
+    if _get_google_client_pool() is not None:
+        return 'sheets'
+    
+    error = google_credentials_error()
+    if error is not None and not st.session_state.get('credentials_error_shown'):
+        st.session_state.credentials_error_shown = True
+        st.error(f"Error connecting to Google Sheets: {error}. Using local storage mode.")
+    return 'sqlite'
+
+def get_ticket_store():
+    """Get the configured TicketStore"""
+    backend = storage_backend()
+    if backend not in TICKET_STORES:
+        raise ValueError(f"Unknown NILONS_STORAGE_BACKEND '{backend}' (expected one of: {', '.join(TICKET_STORES)})")
+    return TICKET_STORES[backend]()
+
+@timed
+def query_tickets(ticket_type, status=None, category=None, assigned_to=None,
+                  received_from=None, received_to=None, ticket_ids=None,
+                  sort_by=None, descending=False, limit=None, offset=0, columns=None,
+                  include_archived=False):
+    """Get one page of matching tickets as (df, total matching count)
+
+    Filters are combined with AND; received_from/received_to are dates
+    (inclusive) and ticket_ids restricts to a set of IDs, e.g. search
+    results. sort_by is a sheet column or a TICKET_TIMESTAMP_COLUMNS name
+    (default: storage order) and columns projects the result. The SQLite
+    store pushes everything down to SQL; Sheets and CSV filter the shared
+    snapshot, since they have no query engine. include_archived also
+    matches archived tickets, filtering them together with the snapshot.
+    """
+    if include_archived:
+        archived = get_archived_tickets(ticket_type)
+        if not archived.empty:
+            filters = {
+                'status': status,
+                'category': category,
+                'assigned_to': assigned_to,
+                'received_from': received_from,
+                'received_to': received_to,
+                'ticket_ids': ticket_ids,
+            }
+            df = concat_tickets([get_tickets(ticket_type), archived])
+            return _query_snapshot(df, filters, sort_by, descending, limit, offset, columns)
+    return get_ticket_store().query(
+        ticket_type, status=status, category=category, assigned_to=assigned_to,
+        received_from=received_from, received_to=received_to, ticket_ids=ticket_ids,
+        sort_by=sort_by, descending=descending, limit=limit, offset=offset, columns=columns
+    )
+
+@timed
+def ticket_status_counts(ticket_type):
+    """Number of tickets per status, e.g. {'Open': 12, 'Closed': 30}"""
+    return get_ticket_store().status_counts(ticket_type)
+
+def save_ticket(ticket_type, ticket_data):
+    """Save a new ticket to the configured store, showing an error if that fails"""
+    try:
+        get_ticket_store().append(ticket_type, ticket_data)
+        return True
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error saving ticket: {e}")
+        return False
+
+def close_ticket(ticket_type, ticket_id, it_member, action_taken):
+    """Close a ticket in the configured store, showing an error if that fails"""
+    try:
+        if get_ticket_store().close(ticket_type, ticket_id, it_member, action_taken):
+            return True
+        st.error(f"Ticket {ticket_id} not found")
+        return False
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error updating ticket: {e}")
+        return False
+
+def close_tickets(ticket_type, ticket_ids, it_member, action_taken):
+    """Close several tickets in one batched write, returning how many were closed (None on error)"""
+    try:
+        return get_ticket_store().close_many(ticket_type, ticket_ids, it_member, action_taken)
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error updating tickets: {e}")
+        return None
+
+def reassign_tickets(ticket_type, ticket_ids, it_member):
+    """Reassign several tickets in one batched write, returning how many were updated (None on error)"""
+    try:
+        return get_ticket_store().assign_many(ticket_type, ticket_ids, it_member)
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error updating tickets: {e}")
+        return None
+
+def read_ticket_import(uploaded_file):
+    """Read an uploaded CSV or Excel (.xlsx, read with openpyxl) file as strings"""
+    if uploaded_file.name.lower().endswith('.xlsx'):
+        df = pd.read_excel(uploaded_file, dtype=str, engine='openpyxl')
+    else:
+        df = pd.read_csv(uploaded_file, dtype=str, keep_default_na=False)
+    return df.fillna('')
+
+def prepare_ticket_import(ticket_type, df):
+    """Turn imported rows into ticket data, returning (tickets, errors)
+
+    Columns are matched to the worksheet headers (or LOCAL_FIELDS names),
+    ignoring case. Received Date/Time default to the import time and
+    Status to Open; rows without a Ticket ID get one when imported. Rows
+    missing a required field, or whose ID already exists, are skipped and
+    reported in errors.
+    """
+    names = {header.lower(): field for header, field in zip(SHEET_HEADERS, LOCAL_FIELDS)}
+    names.update({field: field for field in LOCAL_FIELDS})
+    df = df.rename(columns=lambda column: names.get(str(column).strip().lower(), column))
+    headers = dict(zip(LOCAL_FIELDS, SHEET_HEADERS))
+    
+    missing = [headers[field] for field in IMPORT_REQUIRED_FIELDS if field not in df.columns]
+    if missing:
+        return [], [f"Missing column(s): {', '.join(missing)}"]
+    
+    records = df.to_dict('records')
+    given_ids = [str(record.get('ticket_id', '')).strip() for record in records]
+    existing = set()
+    if any(given_ids):
+        found, _ = query_tickets(ticket_type, ticket_ids=[i for i in given_ids if i], columns=["Ticket ID"])
+        if not found.empty:
+            existing = set(found['Ticket ID'].astype(str))
+    
+    now = datetime.now()
+    tickets = []
+    errors = []
+    for line, record in enumerate(records, start=2):
+        ticket_data = {field: str(record.get(field, '')).strip() for field in LOCAL_FIELDS}
+        empty = [headers[field] for field in IMPORT_REQUIRED_FIELDS if not ticket_data[field]]
+        if empty:
+            errors.append(f"Row {line}: missing {', '.join(empty)}")
+            continue
+        if ticket_data['ticket_id'] in existing:
+            errors.append(f"Row {line}: ticket {ticket_data['ticket_id']} already exists")
+            continue
+        
+        received = pd.to_datetime(ticket_data['received_date'] or now, errors='coerce')
+        if pd.isna(received):
+            errors.append(f"Row {line}: unreadable Received Date '{ticket_data['received_date']}'")
+            continue
+        ticket_data['received_date'] = received.strftime("%Y-%m-%d")
+        if not ticket_data['received_time']:
+            ticket_data['received_time'] = received.strftime("%H:%M:%S")
+        ticket_data['status'] = ticket_data['status'].title() or 'Open'
+        if ticket_data['status'] not in ('Open', 'Closed'):
+            errors.append(f"Row {line}: unknown Status '{ticket_data['status']}'")
+            continue
+        
+        if ticket_data['ticket_id']:
+            existing.add(ticket_data['ticket_id'])
+        tickets.append(ticket_data)
+    return tickets, errors
+
+def import_tickets(ticket_type, tickets):
+    """Store imported tickets in bulk, allocating IDs where missing, showing an error if that fails
+
+    Returns the number of tickets imported, or None on error.
+    """
+    try:
+        new_ids = iter(allocate_ticket_ids(ticket_type, sum(not t['ticket_id'] for t in tickets)))
+        tickets = [dict(t, ticket_id=t['ticket_id'] or next(new_ids)) for t in tickets]
+        get_ticket_store().append_many(ticket_type, tickets)
+        return len(tickets)
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        st.error(f"Error importing tickets: {e}")
+        return None
+
+_ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.tickets (
+        ticket_type TEXT NOT NULL,
+        {columns},
+        archived_at TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (ticket_type, ticket_id)
+    )
+"""
+
+@timed
+def archive_closed_tickets(now=None):
+    """Move tickets closed more than ARCHIVE_AFTER_DAYS ago to per-month archives
+
+    Tickets are filed under the month they were received: worksheets such
+    as "SAP Tickets 2025-01" with Google Sheets, or ticket_archive/2025-01.db
+    locally (in mirror mode, both). Returns {ticket type: number of tickets moved}.
+    Raises ValueError when archiving is turned off (ARCHIVE_AFTER_DAYS <= 0).
+    """
+    if ARCHIVE_AFTER_DAYS <= 0:
+        raise ValueError("Archiving is turned off (NILONS_ARCHIVE_AFTER_DAYS is not positive)")
+    cutoff = pd.Timestamp(now or datetime.now()) - pd.Timedelta(days=ARCHIVE_AFTER_DAYS)
+    backend = storage_backend()
+    moved = {}
+    if backend == 'csv':
+        # The CSV store is for small installs and isn't archived
+        return moved
+    for ticket_type in TICKET_TYPES:
+        if backend == 'sheets':
+            moved[ticket_type] = _archive_sheet_tickets(ticket_type, cutoff)
+        else:
+            moved[ticket_type] = _archive_local_tickets(ticket_type, cutoff)
+            if backend == 'mirror' and _get_google_client_pool() is not None:
+                # The mirrored copies age out of the sheet the same way
+                _archive_sheet_tickets(ticket_type, cutoff)
+        if moved[ticket_type]:
+            logger.info("Archived %d closed %s ticket(s)", moved[ticket_type], ticket_type)
+            invalidate_archive_cache(ticket_type)
+    return moved
+
+def run_scheduled_archival():
+    """Run archive_closed_tickets once per ARCHIVE_INTERVAL across all server processes"""
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return None
+    
+    # Claim the run in the shared local database so only one process does it
+    conn = _local_connection()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'archive:last_run'").fetchone()
+        if row and now - float(row[0]) < ARCHIVE_INTERVAL:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archive:last_run', ?)", (str(now),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return archive_closed_tickets()
+
+def _archive_months(df):
+    """'YYYY-MM' partition of each ticket: its received month, or closing month if that's unknown"""
+    received = df['Received At'].dt.strftime('%Y-%m')
+    return received.fillna(df['Closed At'].dt.strftime('%Y-%m'))
+
+def _archive_worksheet_name(ticket_type, month):
+    """Title of the archive worksheet for one month of a ticket type"""
+    return f"{ticket_type} Tickets {month}"
+
+def _archive_sheet_tickets(ticket_type, cutoff):
+    """Archive old closed tickets of one type from the hot worksheet to monthly worksheets"""
+    client, drive_service = get_google_sheets_client()
+    worksheet = get_or_create_worksheet(client, ticket_type)
+    if not worksheet:
+        return 0
+    
+    try:
+        # Hold the snapshot lock so no session syncs against half-moved rows
+        with _snapshot_lock(_ticket_snapshots(), ticket_type):
+            values = google_request('sheets_read', 'get_all_values', worksheet.get_all_values, key=worksheet.id)
+            if len(values) < 2:
+                return 0
+            headers = values[0]
+            df = _rows_to_frame(values[1:], headers)
+            due = df[(df['Status'] == 'Closed') & (df['Closed At'] < cutoff)]
+            if due.empty:
+                return 0
+            
+            spreadsheet = _open_spreadsheet(client)
+            existing = {ws.title: ws for ws in google_request('sheets_read', 'worksheets', spreadsheet.worksheets)}
+            for month, rows in due.groupby(_archive_months(due), sort=True):
+                name = _archive_worksheet_name(ticket_type, month)
+                archive = existing.get(name)
+                if archive is None:
+                    archive = google_request(
+                        'sheets_write', 'add_worksheet',
+                        lambda: spreadsheet.add_worksheet(title=name, rows=str(len(rows) + 1), cols=str(len(headers))),
+                        idempotent=False
+                    )
+                    google_request('sheets_write', 'append_row', lambda: archive.append_row(headers), idempotent=False)
+                    archived_ids = set()
+                else:
+                    # A previous run may have copied rows and stopped before deleting them
+                    archived_ids = set(google_request('sheets_read', 'col_values', lambda: archive.col_values(1)))
+                new_rows = [values[pos + 1] for pos in rows.index if values[pos + 1][0] not in archived_ids]
+                if new_rows:
+                    google_request('sheets_write', 'append_rows', lambda: archive.append_rows(new_rows), idempotent=False)
+            
+            # Only delete rows that still hold the ticket we copied
+            current_ids = google_request('sheets_read', 'col_values', lambda: worksheet.col_values(1), key=worksheet.id)
+            sheet_rows = [
+                pos + 2 for pos in due.index
+                if pos + 1 < len(current_ids) and current_ids[pos + 1] == values[pos + 1][0]
+            ]
+            _delete_sheet_rows(spreadsheet, worksheet, sheet_rows)
+            invalidate_ticket_row_index(ticket_type)
+            reset_ticket_cache(ticket_type)
+            return len(sheet_rows)
+    except Exception as e:
+        _handle_google_error(e, ticket_type)
+        logger.warning("Archiving %s tickets failed: %s", ticket_type, e)
+        return 0
+
+def _delete_sheet_rows(spreadsheet, worksheet, rows):
+    """Delete sheet rows (1-based) in one batch_update, one request per contiguous run"""
+    runs = []
+    for row in sorted(rows):
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    if not runs:
+        return
+    
+    # Bottom-up, so earlier deletions don't shift the rows of later ones
+    body = {'requests': [
+        {'deleteDimension': {'range': {
+            'sheetId': worksheet.id,
+            'dimension': 'ROWS',
+            'startIndex': first - 1,
+            'endIndex': last,
+        }}}
+        for first, last in reversed(runs)
+    ]}
+    google_request('sheets_write', 'delete_rows', lambda: spreadsheet.batch_update(body), idempotent=False)
+
+def _archive_local_tickets(ticket_type, cutoff):
+    """Archive old closed tickets of one type from the local database to monthly SQLite files"""
+    conn = _local_connection()
+    rows = conn.execute(
+        """
+        SELECT seq, received_date, closing_date FROM tickets
+        WHERE ticket_type = ? AND status = 'Closed' AND closing_date != '' AND closing_date < ?
+        """,
+        (ticket_type, cutoff.strftime("%Y-%m-%d"))
+    ).fetchall()
+    
+    by_month = {}
+    for seq, received_date, closing_date in rows:
+        month = received_date[:7] if re.match(r"\d{4}-\d{2}", received_date) else closing_date[:7]
+        by_month.setdefault(month, []).append(seq)
+    
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    fields = ", ".join(LOCAL_FIELDS)
+    moved = 0
+    for month, seqs in sorted(by_month.items()):
+        conn.execute("ATTACH DATABASE ? AS archive", (os.path.join(ARCHIVE_DIR, f"{month}.db"),))
+        try:
+            conn.execute(_ARCHIVE_SCHEMA.format(
+                columns=",\n        ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in LOCAL_FIELDS)
+            ))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"""
+                    INSERT OR IGNORE INTO archive.tickets (ticket_type, {fields}, archived_at)
+                    SELECT ticket_type, {fields}, ? FROM tickets
+                    WHERE seq IN (SELECT value FROM json_each(?))
+                    """,
+                    (datetime.now().isoformat(), json.dumps(seqs))
+                )
+                conn.execute("DELETE FROM tickets WHERE seq IN (SELECT value FROM json_each(?))", (json.dumps(seqs),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        moved += len(seqs)
+    
+    if moved:
+        reset_ticket_cache(ticket_type)
+    return moved
+
+@st.cache_resource(show_spinner=False)
+def _archive_cache():
+    """Process-wide cache of archived tickets, keyed by ticket type"""
+    return {
+        # ticket type -> {'months': {month: df or None}, 'loaded_at'}
+        'archives': {},
+        'lock': threading.Lock(),
+        'version': 0,
+    }
+
+def invalidate_archive_cache(ticket_type=None):
+    """Forget cached archives after tickets were moved into them"""
+    cache = _archive_cache()
+    with cache['lock']:
+        if ticket_type is None:
+            cache['archives'].clear()
+        else:
+            cache['archives'].pop(ticket_type, None)
+        cache['version'] += 1
+
+def archive_version():
+    """Changes whenever cached archive contents may have changed (for memoization keys)"""
+    return _archive_cache()['version']
+
+def list_archive_months(ticket_type):
+    """Archived months ('YYYY-MM') for a ticket type, oldest first"""
+    cache = _archive_cache()
+    with cache['lock']:
+        entry = cache['archives'].get(ticket_type)
+        if entry is not None and time.monotonic() - entry['loaded_at'] < ARCHIVE_CACHE_TTL:
+            record_cache_access('archive', True)
+            return sorted(entry['months'])
+    record_cache_access('archive', False)
+    
+    try:
+        months = _find_archive_months(ticket_type)
+    except Exception as e:
+        _handle_google_error(e)
+        st.error(f"Error listing archived tickets: {e}")
+        return []
+    
+    with cache['lock']:
+        cache['archives'][ticket_type] = {'months': dict.fromkeys(months), 'loaded_at': time.monotonic()}
+        cache['version'] += 1
+    return sorted(months)
+
+def _find_archive_months(ticket_type):
+    """List archive partitions in Google Sheets or the local archive directory"""
+    if storage_backend() != 'sheets':
+        if not os.path.isdir(ARCHIVE_DIR):
+            return []
+        return [name[:-3] for name in os.listdir(ARCHIVE_DIR) if re.fullmatch(r"\d{4}-\d{2}\.db", name)]
+    
+    pattern = re.compile(re.escape(f"{ticket_type} Tickets ") + r"(\d{4}-\d{2})")
+    spreadsheet = _open_spreadsheet(_get_google_client_pool()['client'])
+    worksheets = google_request('sheets_read', 'worksheets', spreadsheet.worksheets)
+    return [m.group(1) for m in (pattern.fullmatch(ws.title) for ws in worksheets) if m]
+
+@timed
+def get_archived_tickets(ticket_type, start_month=None, end_month=None):
+    """Archived tickets received in [start_month, end_month] ('YYYY-MM', inclusive), typed like a snapshot
+
+    Only the months asked for are read; each is cached until ARCHIVE_CACHE_TTL.
+    """
+    months = [
+        month for month in list_archive_months(ticket_type)
+        if (start_month is None or month >= start_month) and (end_month is None or month <= end_month)
+    ]
+    
+    cache = _archive_cache()
+    frames = []
+    for month in months:
+        with cache['lock']:
+            entry = cache['archives'].get(ticket_type)
+            df = entry['months'].get(month) if entry else None
+        if df is None:
+            try:
+                df = _load_archive_month(ticket_type, month)
+            except Exception as e:
+                _handle_google_error(e)
+                st.error(f"Error reading archived tickets for {month}: {e}")
+                continue
+            with cache['lock']:
+                entry = cache['archives'].get(ticket_type)
+                if entry is not None:
+                    entry['months'][month] = df
+        if not df.empty:
+            frames.append(df)
+    return concat_tickets(frames) if frames else pd.DataFrame()
+
+def _load_archive_month(ticket_type, month):
+    """Read one archived month of tickets"""
+    if storage_backend() != 'sheets':
+        conn = sqlite3.connect(os.path.join(ARCHIVE_DIR, f"{month}.db"))
+        try:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(LOCAL_FIELDS)} FROM tickets WHERE ticket_type = ?",
+                conn,
+                params=(ticket_type,)
+            )
+        finally:
+            conn.close()
+        return apply_ticket_schema(df.rename(columns=dict(zip(LOCAL_FIELDS, SHEET_HEADERS))))
+    
+    spreadsheet = _open_spreadsheet(_get_google_client_pool()['client'])
+    worksheet = google_request('sheets_read', 'worksheet', lambda: spreadsheet.worksheet(_archive_worksheet_name(ticket_type, month)))
+    values = google_request('sheets_read', 'get_all_values', worksheet.get_all_values, key=worksheet.id)
+    if not values:
+        return pd.DataFrame()
+    return _rows_to_frame(values[1:], values[0])
+
+@timed
+def enqueue_ticket(ticket_data, ticket_type, image_file=None):
+    """Durably queue a new ticket for the background worker to write to Google
+
+    The attachment (if any) is spooled to disk next to the queue so the
+    worker can upload it after the user's request has returned.
+    """
+    image_path = image_name = image_type = ''
+    if image_file is not None:
+        os.makedirs(OUTBOX_SPOOL_DIR, exist_ok=True)
+        image_name = image_file.name
+        image_type = image_file.type or 'application/octet-stream'
+        image_path = os.path.join(OUTBOX_SPOOL_DIR, f"{ticket_data['ticket_id']}_{image_name}")
+        image_file.seek(0)
+        with open(image_path, "wb") as f:
+            shutil.copyfileobj(image_file, f)
+    
+    now = time.time()
+    conn = _local_connection()
+    conn.execute(
+        """
+        INSERT INTO outbox (ticket_type, ticket_id, payload, image_path, image_name, image_type,
+                            created_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (ticket_type, ticket_data['ticket_id'], json.dumps(ticket_data),
+         image_path, image_name, image_type, now, now)
+    )
+    _outbox_worker()['wake'].set()
+
+def get_outbox_status():
+    """Get queue depth, flush lag (age of the oldest entry), the latest error and the failed attachment count"""
+    conn = _local_connection()
+    depth, oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM outbox").fetchone()
+    last_error = conn.execute(
+        "SELECT last_error FROM outbox WHERE last_error != '' ORDER BY id LIMIT 1"
+    ).fetchone()
+    return {
+        'depth': depth,
+        'lag_seconds': time.time() - oldest if oldest is not None else 0.0,
+        'last_error': last_error[0] if last_error else '',
+        'failed_attachments': conn.execute("SELECT COUNT(*) FROM failed_attachments").fetchone()[0],
+    }
+
+@st.cache_resource(show_spinner=False)
+def _outbox_worker():
+    """Start the process-wide background thread that flushes the outbox"""
+    worker = {'wake': threading.Event()}
+    worker['thread'] = threading.Thread(
+        target=_run_outbox_worker, args=(worker['wake'],), name="ticket-outbox", daemon=True
+    )
+    worker['thread'].start()
+    return worker
+
+def start_outbox_worker():
+    """Make sure queued tickets (including ones left from a previous run) get flushed"""
+    _outbox_worker()
+
+def _run_outbox_worker(wake):
+    """Flush due outbox entries forever, sleeping until the next one is due
+
+    The same thread runs the daily archival job and, in mirror mode, the
+    sync with Google Sheets between flushes.
+    """
+    while True:
+        try:
+            delay = flush_outbox()
+        except Exception:
+            logger.exception("Outbox flush failed")
+            delay = OUTBOX_RETRY_BASE
+        try:
+            run_scheduled_archival()
+        except Exception:
+            logger.exception("Scheduled archival failed")
+        try:
+            delay = min(delay, run_ticket_mirror())
+        except Exception:
+            logger.exception("Ticket mirror failed")
+        wake.wait(timeout=delay)
+        wake.clear()
+
+@timed
+def flush_outbox():
+    """Write every due outbox entry to Google, returning seconds until the next is due"""
+    conn = _local_connection()
+    while True:
+        now = time.time()
+        entry = _claim_outbox_entry(conn, now)
+        if entry is None:
+            break
+        _flush_outbox_entry(conn, entry)
+    
+    next_due = conn.execute("SELECT MIN(next_attempt_at) FROM outbox").fetchone()[0]
+    if next_due is None:
+        return OUTBOX_IDLE_POLL
+    return min(max(next_due - time.time(), 0.1), OUTBOX_IDLE_POLL)
+
+def _claim_outbox_entry(conn, now):
+    """Lease the oldest due entry so other server processes skip it while we work"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            """
+            SELECT id, ticket_type, ticket_id, payload, image_path, image_name, image_type, attempts
+            FROM outbox
+            WHERE next_attempt_at <= ? AND claimed_until <= ?
+            ORDER BY id LIMIT 1
+            """,
+            (now, now)
+        ).fetchone()
+        if row is not None:
+            conn.execute("UPDATE outbox SET claimed_until = ? WHERE id = ?", (now + OUTBOX_LEASE, row[0]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    if row is None:
         return None
+    keys = ['id', 'ticket_type', 'ticket_id', 'payload', 'image_path', 'image_name', 'image_type', 'attempts']
+    return dict(zip(keys, row))
 
-def save_image_locally(image_file, ticket_id):
-    """Fallback: Save image locally and return local path"""
+def _flush_outbox_entry(conn, entry):
+    """Upload the attachment and append the ticket row, rescheduling the entry on failure
+
+    An attachment that fails permanently (e.g. Drive storage quota, a
+    deleted spool file) or OUTBOX_IMAGE_ATTEMPTS times doesn't hold the
+    ticket back: the row is appended without an image URL and the upload
+    is recorded in failed_attachments, keeping the spooled file.
+    """
+    ticket_data = json.loads(entry['payload'])
+    ticket_type = entry['ticket_type']
     try:
-        # Create images directory if it doesn't exist
-        images_dir = "ticket_images"
-        os.makedirs(images_dir, exist_ok=True)
+        pool = _get_google_client_pool()
+        if pool is None:
+            raise RuntimeError("Google Sheets credentials not found")
         
-        # Save the file
-        file_path = os.path.join(images_dir, f"{ticket_id}_{image_file.name}")
-        with open(file_path, "wb") as f:
-            f.write(image_file.read())
+        if entry['image_path'] and not ticket_data.get('image_url') and not ticket_data.get('image_failed'):
+            try:
+                with open(entry['image_path'], "rb") as f:
+                    ticket_data['image_url'] = _upload_image_with_variants(
+                        pool['drive_service'], f,
+                        f"{entry['ticket_id']}_{entry['image_name']}", entry['image_type']
+                    )
+            except Exception as e:
+                if not _is_permanent_upload_error(e) and entry['attempts'] + 1 < OUTBOX_IMAGE_ATTEMPTS:
+                    raise
+                _handle_google_error(e)
+                logger.warning("Giving up on the attachment of ticket %s, saving it without: %s",
+                               entry['ticket_id'], e)
+                _record_failed_attachment(conn, entry, e)
+                ticket_data['image_failed'] = True
+            # Remember the outcome so a retry doesn't upload the image again
+            conn.execute("UPDATE outbox SET payload = ? WHERE id = ?", (json.dumps(ticket_data), entry['id']))
         
-        return file_path
+        if not ticket_data.get('appended'):
+            worksheet = _get_worksheet_entry(pool['client'], ticket_type)['worksheet']
+            # An earlier attempt, or a worker that crashed or lost its lease,
+            # may have appended the row without getting to delete the entry
+            if not lookup_ticket_row(ticket_type, entry['ticket_id'], worksheet):
+                _append_ticket_to_worksheet(worksheet, ticket_data, ticket_type)
+            ticket_data['appended'] = True
+            conn.execute("UPDATE outbox SET payload = ? WHERE id = ?", (json.dumps(ticket_data), entry['id']))
     except Exception as e:
-        st.error(f"Error saving image locally: {e}")
-        return None
-
-def save_ticket_to_sheets(ticket_data, ticket_type):
-    """Save ticket to Google Sheets"""
-    client, drive_service = get_google_sheets_client()
-    worksheet = get_or_create_worksheet(client, ticket_type)
+        _handle_google_error(e, ticket_type)
+        attempts = entry['attempts'] + 1
+        delay = min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning("Ticket %s not synced (attempt %d), retrying in %.0fs: %s",
+                       entry['ticket_id'], attempts, delay, e)
+        conn.execute(
+            "UPDATE outbox SET attempts = ?, next_attempt_at = ?, claimed_until = 0, last_error = ? WHERE id = ?",
+            (attempts, time.time() + delay, str(e)[:500], entry['id'])
+        )
+        return
     
-    if worksheet:
-        try:
-            row = [
-                ticket_data['ticket_id'],
-                ticket_data['type_of_query'],
-                ticket_data['ss_db_dp_name'],
-                ticket_data['ss_db_dp_code'],
-                ticket_data['city'],
-                ticket_data['state'],
-                ticket_data['incident_category'],
-                ticket_data['subject'],
-                ticket_data['call_received_from'],
-                ticket_data['received_date'],
-                ticket_data['received_time'],
-                ticket_data['status'],
-                ticket_data.get('it_member_assigned', ''),
-                ticket_data.get('closing_date', ''),
-                ticket_data.get('closing_time', ''),
-                ticket_data.get('action_taken', ''),
-                ticket_data.get('image_url', '')
-            ]
-            worksheet.append_row(row)
-            return True
-        except Exception as e:
-            st.error(f"Error saving to Google Sheets: {e}")
-            return False
-    else:
-        # Fallback to local CSV storage
-        save_ticket_to_csv(ticket_data, ticket_type)
+    conn.execute("DELETE FROM outbox WHERE id = ?", (entry['id'],))
+    if entry['image_path'] and not ticket_data.get('image_failed') and os.path.exists(entry['image_path']):
+        os.remove(entry['image_path'])
+
+def _is_permanent_upload_error(error):
+    """Check whether retrying an attachment upload can't help (missing file, 4xx other than rate limits)"""
+    if isinstance(error, FileNotFoundError):
         return True
+    status = _google_error_status(error)
+    if status is None or status in GOOGLE_RETRY_STATUSES or status == 401:
+        return False
+    return not (status == 403 and re.search(r"rate ?limit", str(error), re.IGNORECASE))
+
+def _record_failed_attachment(conn, entry, error):
+    """Keep track of an attachment that was given up on, so staff can attach it by hand"""
+    conn.execute(
+        """
+        INSERT INTO failed_attachments (ticket_type, ticket_id, image_path, image_name, error, failed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (entry['ticket_type'], entry['ticket_id'], entry['image_path'], entry['image_name'],
+         str(error)[:500], time.time())
+    )
+
+def get_failed_attachments():
+    """Attachments that never reached Drive, newest first, as a DataFrame"""
+    return pd.read_sql_query(
+        """
+        SELECT ticket_type AS "Type", ticket_id AS "Ticket ID", image_name AS "Image",
+               image_path AS "Saved At", error AS "Error"
+        FROM failed_attachments ORDER BY id DESC
+        """,
+        _local_connection()
+    )
+
+def _get_meta(conn, key, default=None):
+    """Read a value from the meta table"""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_meta(conn, key, value):
+    """Write a value to the meta table"""
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def get_mirror_status():
+    """Get the number of unsynced local changes, the last successful sync time and the latest error"""
+    conn = _local_connection()
+    pending, oldest = conn.execute(
+        "SELECT COUNT(*), MIN(changed_at) FROM ticket_changes WHERE synced_at IS NULL"
+    ).fetchone()
+    synced_at = _get_meta(conn, 'mirror:synced_at')
+    return {
+        'pending': pending,
+        'lag_seconds': time.time() - oldest if oldest is not None else 0.0,
+        'synced_at': float(synced_at) if synced_at else None,
+        'last_error': _get_meta(conn, 'mirror:last_error', ''),
+    }
+
+def get_ticket_changes(ticket_type, ticket_id):
+    """Get the change log of one ticket, oldest first"""
+    return pd.read_sql_query(
+        """
+        SELECT field, old_value, new_value, source, changed_at, synced_at FROM ticket_changes
+        WHERE ticket_type = ? AND ticket_id = ? ORDER BY id
+        """,
+        _local_connection(),
+        params=(ticket_type, ticket_id)
+    )
+
+def run_ticket_mirror(force=False):
+    """Run sync_ticket_mirror if it is due, returning seconds until the next check
 
-def save_ticket_to_csv(ticket_data, ticket_type):
-    """Fallback: Save ticket to local CSV file"""
-    filename = f"{ticket_type.lower()}_tickets.csv"
+    A sync is due MIRROR_INTERVAL after the previous attempt, or
+    MIRROR_PUSH_DELAY after the oldest unsynced local change (unless the
+    last attempt failed). A lease in the shared local database keeps other
+    server processes from syncing at the same time.
+    """
+    if storage_backend() != 'mirror' or _get_google_client_pool() is None:
+        return MIRROR_INTERVAL
     
-    df_new = pd.DataFrame([ticket_data])
+    conn = _local_connection()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        due = float(_get_meta(conn, 'mirror:attempted_at', 0)) + MIRROR_INTERVAL
+        pending_since = conn.execute(
+            "SELECT MIN(changed_at) FROM ticket_changes WHERE synced_at IS NULL"
+        ).fetchone()[0]
+        if pending_since is not None and not _get_meta(conn, 'mirror:last_error'):
+            due = min(due, pending_since + MIRROR_PUSH_DELAY)
+        leased = float(_get_meta(conn, 'mirror:lease', 0)) > now
+        if leased or (now < due and not force):
+            conn.execute("COMMIT")
+            return min(max(due - now, 1), MIRROR_INTERVAL)
+        _set_meta(conn, 'mirror:lease', now + MIRROR_LEASE)
+        _set_meta(conn, 'mirror:attempted_at', now)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
     
-    if os.path.exists(filename):
-        df_existing = pd.read_csv(filename)
-        df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-        df_combined.to_csv(filename, index=False)
-    else:
-        df_new.to_csv(filename, index=False)
+    error = ''
+    try:
+        results = sync_ticket_mirror(force_pull=force)
+        for ticket_type, result in results.items():
+            if result['pushed'] or result['pulled']:
+                logger.info("Mirrored %s tickets: %d row(s) pushed, %d pulled, %d conflict(s)",
+                            ticket_type, result['pushed'], result['pulled'], result['conflicts'])
+    except Exception as e:
+        _handle_google_error(e)
+        logger.warning("Ticket mirror sync failed, retrying in %ds: %s", MIRROR_INTERVAL, e)
+        error = str(e)[:500]
+    
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not error:
+            _set_meta(conn, 'mirror:synced_at', time.time())
+        _set_meta(conn, 'mirror:last_error', error)
+        _set_meta(conn, 'mirror:lease', 0)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return MIRROR_INTERVAL
 
-def get_tickets_from_sheets(ticket_type):
-    """Get tickets from Google Sheets"""
-    client, drive_service = get_google_sheets_client()
-    worksheet = get_or_create_worksheet(client, ticket_type)
+def _spreadsheet_modified_time(pool, spreadsheet):
+    """When the spreadsheet was last modified (RFC 3339), according to Google Drive"""
+    drive_service = pool['drive_service']
+    with _drive_lock():
+        result = google_request(
+            'drive', 'files.get',
+            drive_service.files().get(fileId=spreadsheet.id, fields='modifiedTime').execute
+        )
+    return result.get('modifiedTime', '')
+
+@timed
+def sync_ticket_mirror(force_pull=False):
+    """Reconcile the local ticket database with the Google worksheets
+
+    Pending local changes are pushed on every run. The worksheets are read
+    in full only when Drive reports the spreadsheet changed since the last
+    pull, every FULL_SYNC_INTERVAL seconds, or with force_pull.
+    Returns {ticket type: {'pushed', 'pulled', 'conflicts'}}.
+    """
+    pool = _get_google_client_pool()
+    if pool is None:
+        raise RuntimeError("Google Sheets credentials not found")
+    spreadsheet = _open_spreadsheet(pool['client'])
+    conn = _local_connection()
     
-    if worksheet:
-        try:
-            data = worksheet.get_all_records()
-            return pd.DataFrame(data)
-        except Exception as e:
-            st.error(f"Error reading from Google Sheets: {e}")
-            return get_tickets_from_csv(ticket_type)
-    else:
-        return get_tickets_from_csv(ticket_type)
+    modified = _spreadsheet_modified_time(pool, spreadsheet)
+    pull = (
+        force_pull
+        or modified != _get_meta(conn, 'mirror:sheet_modified')
+        or time.time() - float(_get_meta(conn, 'mirror:pulled_at', 0)) >= FULL_SYNC_INTERVAL
+    )
+    # Drive only tracks when the spreadsheet as a whole last changed, so
+    # that is the time given to every edit found in the sheet
+    sheet_edited_at = pd.Timestamp(modified).timestamp() if modified else time.time()
+    
+    results = {
+        ticket_type: _mirror_ticket_type(conn, pool['client'], ticket_type, pull, sheet_edited_at)
+        for ticket_type in TICKET_TYPES
+    }
+    if any(result['pushed'] for result in results.values()):
+        # Our own writes changed modifiedTime; don't take them for edits next time.
+        # Edits made by others meanwhile are picked up by the next full pull
+        modified = _spreadsheet_modified_time(pool, spreadsheet)
+    _set_meta(conn, 'mirror:sheet_modified', modified)
+    if pull:
+        _set_meta(conn, 'mirror:pulled_at', time.time())
+    return results
 
-def get_tickets_from_csv(ticket_type):
-    """Fallback: Get tickets from local CSV"""
-    filename = f"{ticket_type.lower()}_tickets.csv"
-    if os.path.exists(filename):
-        return pd.read_csv(filename)
-    else:
-        return pd.DataFrame()
+def _mirror_local_rows(conn, ticket_type, ticket_ids=None):
+    """Local tickets (all, or only ticket_ids) as {ticket ID: values in SHEET_HEADERS order}"""
+    sql = f"SELECT {', '.join(LOCAL_FIELDS)} FROM tickets WHERE ticket_type = ?"
+    params = [ticket_type]
+    if ticket_ids is not None:
+        sql += " AND ticket_id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(ticket_ids))
+    return {row[0]: list(row) for row in conn.execute(sql + " ORDER BY seq", params)}
 
-def update_ticket_in_sheets(ticket_id, ticket_type, it_member, action_taken):
-    """Update ticket status in Google Sheets"""
-    client, drive_service = get_google_sheets_client()
-    worksheet = get_or_create_worksheet(client, ticket_type)
+def _mirror_base_rows(conn, ticket_type, ticket_ids=None):
+    """Sheet rows as of the last sync (all, or only ticket_ids) as {ticket ID: values}"""
+    sql = "SELECT ticket_id, row_values FROM mirror_rows WHERE ticket_type = ?"
+    params = [ticket_type]
+    if ticket_ids is not None:
+        sql += " AND ticket_id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(ticket_ids))
+    return {ticket_id: json.loads(values) for ticket_id, values in conn.execute(sql, params)}
+
+def _mirror_ticket_type(conn, client, ticket_type, pull, sheet_edited_at):
+    """Push the pending local changes of one ticket type and, when pulling, merge in the sheet's edits
+
+    Each field is compared with the copy of the sheet row saved at the last
+    sync (mirror_rows). A field changed on one side only takes that side's
+    value; changed on both sides, the later change wins, with sheet edits
+    dated sheet_edited_at. Tickets missing on one side are copied over,
+    unless they were synced before (i.e. deleted or archived since).
+    """
+    max_change = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ticket_changes").fetchone()[0]
+    # Ticket ID -> {column: time of the latest unsynced local change}; '' marks a new ticket
+    pending = {}
+    for ticket_id, field, changed_at in conn.execute(
+        """
+        SELECT ticket_id, field, MAX(changed_at) FROM ticket_changes
+        WHERE ticket_type = ? AND synced_at IS NULL AND id <= ?
+        GROUP BY ticket_id, field
+        """,
+        (ticket_type, max_change)
+    ):
+        pending.setdefault(ticket_id, {})[field] = changed_at
     
-    closing_date = datetime.now().strftime("%Y-%m-%d")
-    closing_time = datetime.now().strftime("%H:%M:%S")
+    result = {'pushed': 0, 'pulled': 0, 'conflicts': 0}
+    if not pending and not pull:
+        return result
     
-    if worksheet:
-        try:
-            # Find the row with the ticket ID
-            cell = worksheet.find(ticket_id)
-            row_num = cell.row
-            
-            # Update the row
-            worksheet.update_cell(row_num, 12, "Closed")  # Status
-            worksheet.update_cell(row_num, 13, it_member)  # IT Member Assigned
-            worksheet.update_cell(row_num, 14, closing_date)  # Closing Date
-            worksheet.update_cell(row_num, 15, closing_time)  # Closing Time
-            worksheet.update_cell(row_num, 16, action_taken)  # Action Taken
-            return True
-        except Exception as e:
-            st.error(f"Error updating Google Sheets: {e}")
-            return False
+    if not pull:
+        base = _mirror_base_rows(conn, ticket_type, list(pending))
+        # A change to a ticket that was never synced needs the sheet's current row
+        pull = any(ticket_id not in base and '' not in fields for ticket_id, fields in pending.items())
+    if pull:
+        base = _mirror_base_rows(conn, ticket_type)
+    local = _mirror_local_rows(conn, ticket_type, None if pull else list(pending))
+    
+    entry = _get_worksheet_entry(client, ticket_type)
+    worksheet, headers = entry['worksheet'], entry['headers']
+    columns = [headers.index(name) if name in headers else None for name in SHEET_HEADERS]
+    # Ticket ID -> (row number, values in SHEET_HEADERS order)
+    sheet = {}
+    if pull:
+        rows = google_request('sheets_read', 'get_all_values', lambda: worksheet.get_all_values(), key=worksheet.id)
+        for row_num, row in enumerate(rows[1:], start=2):
+            if row and row[0] and row[0] not in sheet:
+                sheet[row[0]] = (row_num, [row[col] if col is not None and col < len(row) else '' for col in columns])
     else:
-        # Fallback to CSV
-        return update_ticket_in_csv(ticket_id, ticket_type, it_member, action_taken, closing_date, closing_time)
-
-def update_ticket_in_csv(ticket_id, ticket_type, it_member, action_taken, closing_date, closing_time):
-    """Fallback: Update ticket in local CSV"""
-    filename = f"{ticket_type.lower()}_tickets.csv"
-    
-    if os.path.exists(filename):
-        df = pd.read_csv(filename)
-        mask = df['ticket_id'] == ticket_id
-        df.loc[mask, 'status'] = 'Closed'
-        df.loc[mask, 'it_member_assigned'] = it_member
-        df.loc[mask, 'closing_date'] = closing_date
-        df.loc[mask, 'closing_time'] = closing_time
-        df.loc[mask, 'action_taken'] = action_taken
-        df.to_csv(filename, index=False)
-        return True
-    return False
+        # Nothing changed in the sheet since the last pull, so the saved copy is current
+        ticket_ids = google_request('sheets_read', 'col_values', lambda: worksheet.col_values(1), key=worksheet.id)
+        for row_num, ticket_id in enumerate(ticket_ids[1:], start=2):
+            if ticket_id in local and ticket_id not in sheet:
+                sheet[ticket_id] = (row_num, base.get(ticket_id) or local[ticket_id])
+    
+    updates = {}  # sheet row -> {column: local value}
+    appends = []
+    pulls = {}  # ticket ID -> {column: sheet value}
+    inserts = []
+    synced = {}  # ticket ID -> sheet row after this sync
+    for ticket_id, local_values in local.items():
+        if ticket_id not in sheet:
+            if ticket_id not in base:
+                appends.append(local_values)
+                synced[ticket_id] = local_values
+            continue
+        
+        row_num, sheet_values = sheet[ticket_id]
+        base_values = base.get(ticket_id)
+        changed = pending.get(ticket_id, {})
+        merged = list(sheet_values)
+        for i, name in enumerate(SHEET_HEADERS):
+            if local_values[i] == sheet_values[i]:
+                continue
+            sheet_changed = base_values is None or sheet_values[i] != base_values[i]
+            local_changed_at = changed.get(name, changed.get(''))
+            if sheet_changed and local_changed_at is not None:
+                result['conflicts'] += 1
+                local_wins = local_changed_at > sheet_edited_at
+            else:
+                local_wins = not sheet_changed
+            if not local_wins:
+                pulls.setdefault(ticket_id, {})[name] = sheet_values[i]
+            elif columns[i] is not None:
+                updates.setdefault(row_num, {})[name] = local_values[i]
+                merged[i] = local_values[i]
+        if merged != base_values:
+            synced[ticket_id] = merged
+    
+    for ticket_id, (row_num, sheet_values) in sheet.items():
+        if ticket_id not in local and ticket_id not in base:
+            inserts.append(sheet_values)
+            synced[ticket_id] = sheet_values
+    
+    # Write to Google first: if that fails nothing is marked as synced and the next run retries
+    if appends:
+        rows = [[values[SHEET_HEADERS.index(name)] if name in SHEET_HEADERS else '' for name in headers]
+                for values in appends]
+        for start in range(0, len(rows), SHEETS_APPEND_CHUNK):
+            chunk = rows[start:start + SHEETS_APPEND_CHUNK]
+            google_request('sheets_write', 'append_rows', lambda: worksheet.append_rows(chunk), idempotent=False)
+        invalidate_ticket_row_index(ticket_type)
+    if updates:
+        data = [update for row_num, fields in sorted(updates.items())
+                for update in _row_update_ranges(headers, row_num, fields)]
+        google_request('sheets_write', 'batch_update', lambda: worksheet.batch_update(data, value_input_option='RAW'))
+    
+    columns_by_name = dict(zip(SHEET_HEADERS, LOCAL_FIELDS))
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Fields edited locally while we were talking to Google keep the local value
+        newer = set(conn.execute(
+            "SELECT ticket_id, field FROM ticket_changes WHERE ticket_type = ? AND id > ?",
+            (ticket_type, max_change)
+        ).fetchall())
+        log = []
+        for ticket_id, fields in pulls.items():
+            fields = {name: value for name, value in fields.items()
+                      if (ticket_id, name) not in newer and (ticket_id, '') not in newer}
+            if not fields:
+                continue
+            conn.execute(
+                f"UPDATE tickets SET {', '.join(f'{columns_by_name[name]} = ?' for name in fields)} "
+                "WHERE ticket_type = ? AND ticket_id = ?",
+                list(fields.values()) + [ticket_type, ticket_id]
+            )
+            log += [
+                (ticket_type, ticket_id, name, local[ticket_id][SHEET_HEADERS.index(name)], value, sheet_edited_at, now)
+                for name, value in fields.items()
+            ]
+        log += [(ticket_type, values[0], '', '', '', sheet_edited_at, now) for values in inserts]
+        conn.executemany(_LOCAL_INSERT_SQL, [[ticket_type] + values for values in inserts])
+        conn.executemany(
+            """
+            INSERT INTO ticket_changes (ticket_type, ticket_id, field, old_value, new_value, source, changed_at, synced_at)
+            VALUES (?, ?, ?, ?, ?, 'sheet', ?, ?)
+            """,
+            log
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO mirror_rows (ticket_type, ticket_id, row_values) VALUES (?, ?, ?)",
+            [(ticket_type, ticket_id, json.dumps(values)) for ticket_id, values in synced.items()]
+        )
+        conn.execute(
+            "UPDATE ticket_changes SET synced_at = ? WHERE ticket_type = ? AND synced_at IS NULL AND id <= ?",
+            (now, ticket_type, max_change)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    if pulls or inserts:
+        invalidate_ticket_cache(ticket_type)
+    result['pushed'] = len(appends) + len(updates)
+    result['pulled'] = len(pulls) + len(inserts)
+    return result
 
+@timed
 def submit_ticket_page():
     """Page for submitting tickets (accessible to everyone)"""
     st.markdown("<h1 class='main-header'>Nilons IT Ticketing System</h1>", unsafe_allow_html=True)
@@ -444,28 +3545,18 @@ def submit_ticket_page():
             else:
                 # Generate ticket ID
                 now = datetime.now()
-                ticket_id = f"{ticket_type}-{now.strftime('%Y%m%d%H%M%S')}"
+                ticket_id = allocate_ticket_id(ticket_type, now)
                 
                 # Handle image upload
                 image_url = ''
-                if uploaded_image:
-                    with st.spinner('Uploading image...'):
-                        client, drive_service = get_google_sheets_client()
-                        if drive_service:
-                            # Reset file pointer
-                            uploaded_image.seek(0)
-                            image_url = upload_image_to_drive(drive_service, uploaded_image, ticket_id)
-                            if image_url:
-                                st.success("✅ Image uploaded successfully!")
-                            else:
-                                st.warning("⚠️ Image upload failed, but ticket will still be created")
-                        else:
-                            # Fallback to local storage
-                            uploaded_image.seek(0)
-                            image_path = save_image_locally(uploaded_image, ticket_id)
-                            if image_path:
-                                image_url = f"local://{image_path}"
-                                st.info("📁 Image saved locally (Google Drive not configured)")
+                use_outbox = storage_backend() == 'sheets'
+                if uploaded_image and not use_outbox:
+                    # Google Drive not configured: store the image locally
+                    uploaded_image.seek(0)
+                    image_path = save_image_locally(uploaded_image, ticket_id)
+                    if image_path:
+                        image_url = f"local://{image_path}"
+                        st.info("📁 Image saved locally (Google Drive not configured)")
                 
                 # Create ticket data
                 ticket_data = {
@@ -488,8 +3579,19 @@ def submit_ticket_page():
                     'image_url': image_url
                 }
                 
-                # Save ticket
-                if save_ticket_to_sheets(ticket_data, ticket_type):
+                # Save ticket: with Google configured the ticket is queued locally and
+                # written to Sheets/Drive in the background, so the user never waits on Google
+                if use_outbox:
+                    try:
+                        enqueue_ticket(ticket_data, ticket_type, uploaded_image)
+                        saved = True
+                    except Exception as e:
+                        st.error(f"Error queueing ticket: {e}")
+                        saved = False
+                else:
+                    saved = save_ticket(ticket_type, ticket_data)
+                
+                if saved:
                     st.markdown(f"""
                     <div class='success-box'>
                         <h3>✅ Ticket Submitted Successfully!</h3>
@@ -498,7 +3600,7 @@ def submit_ticket_page():
                         </p>
                         <p style='margin: 0.5rem 0;'>Your ticket has been recorded and assigned to our IT team. 
                         Please save this Ticket ID for future reference.</p>
-                        {f"<p style='margin: 0.5rem 0;'>📷 Image attached</p>" if image_url else ""}
+                        {f"<p style='margin: 0.5rem 0;'>📷 Image attached</p>" if uploaded_image else ""}
                     </div>
                     """, unsafe_allow_html=True)
                     st.balloons()
@@ -546,6 +3648,7 @@ def it_login_page():
             </div>
             """, unsafe_allow_html=True)
 
+@timed
 def view_tickets_page():
     """Page for IT staff to view and manage tickets"""
     st.markdown("<h1 class='main-header'>Ticket Management Portal</h1>", unsafe_allow_html=True)
@@ -565,143 +3668,700 @@ def view_tickets_page():
         horizontal=True
     )
     
+    sort_order = st.radio(
+        "Sort by Received",
+        ["Oldest first", "Newest first"],
+        horizontal=True
+    )
+    
+    search_query = st.text_input(
+        "🔍 Search tickets",
+        placeholder="Subject, action taken, SS/DB/DP name or code, city, caller, ticket ID..."
+    ).strip()
+    include_archived = st.checkbox(
+        "Include archived tickets",
+        key="tickets_archived",
+        help="Also list and search tickets moved to the monthly archives"
+    )
+    
+    render_ticket_import(ticket_type)
+    
     st.markdown("---")
     
-    # Get tickets
-    df = get_tickets_from_sheets(ticket_type)
+    # Metrics only need per-status counts
+    status_counts = ticket_status_counts(ticket_type)
+    total_tickets = sum(status_counts.values())
     
-    if df.empty:
+    if total_tickets == 0 and not include_archived:
         st.info(f"📭 No {ticket_type} tickets found.")
         return
     
-    # Apply status filter
-    if status_filter != "All":
-        df = df[df['Status'] == status_filter]
+    # Apply search (answered from the search index, which covers both ticket types)
+    ticket_ids = None
+    if search_query:
+        matches = search_tickets(search_query, include_archived=include_archived)
+        ticket_ids = matches[ticket_type]
+        other_matches = {t: len(ids) for t, ids in matches.items() if t != ticket_type and ids}
+        for other_type, count in other_matches.items():
+            st.caption(f"🔍 {count} {other_type} ticket(s) also match \"{search_query}\"")
     
-    if df.empty:
-        st.info(f"📭 No {status_filter.lower()} {ticket_type} tickets found.")
+    # Start from the first page whenever the filters change
+    filter_key = (ticket_type, status_filter, search_query, sort_order, include_archived)
+    if st.session_state.get('tickets_filter_key') != filter_key:
+        st.session_state.tickets_filter_key = filter_key
+        st.session_state.tickets_page = 1
+    
+    page_size = st.session_state.get('tickets_page_size', TICKET_PAGE_SIZES[1])
+    page = max(st.session_state.get('tickets_page', 1), 1)
+    
+    # Only the visible page, and only the columns the table shows, are fetched
+    def fetch_page(page):
+        return query_tickets(
+            ticket_type,
+            status=None if status_filter == "All" else status_filter,
+            ticket_ids=ticket_ids,
+            sort_by="Received At",
+            descending=sort_order == "Newest first",
+            limit=page_size,
+            offset=(page - 1) * page_size,
+            columns=TICKET_SUMMARY_COLUMNS + ["Image URL"],
+            include_archived=include_archived
+        )
+    
+    page_df, total = fetch_page(page)
+    page_count = max(1, -(-total // page_size))
+    if page > page_count:
+        page = page_count
+        page_df, total = fetch_page(page)
+    st.session_state.tickets_page = page
+    
+    if total == 0:
+        if search_query:
+            st.info(f"📭 No {ticket_type} tickets match \"{search_query}\".")
+        else:
+            st.info(f"📭 No {status_filter.lower()} {ticket_type} tickets found.")
         return
     
     # Display metrics
-    all_tickets = get_tickets_from_sheets(ticket_type)
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Tickets", len(all_tickets))
+        st.metric("Total Tickets", total_tickets)
     with col2:
-        open_tickets = len(all_tickets[all_tickets['Status'] == 'Open']) if 'Status' in all_tickets.columns else 0
-        st.metric("Open Tickets", open_tickets)
+        st.metric("Open Tickets", status_counts.get('Open', 0))
     with col3:
-        closed_tickets = len(all_tickets[all_tickets['Status'] == 'Closed']) if 'Status' in all_tickets.columns else 0
-        st.metric("Closed Tickets", closed_tickets)
+        st.metric("Closed Tickets", status_counts.get('Closed', 0))
+    
+    render_outbox_status()
+    render_mirror_status()
+    
+    st.markdown("---")
+    st.markdown(f"### Showing {total} {status_filter if status_filter != 'All' else ''} Ticket(s)")
+    if 'tickets_message' in st.session_state:
+        st.success(st.session_state.pop('tickets_message'))
+    
+    start = (page - 1) * page_size
+    summary = page_df[[c for c in TICKET_SUMMARY_COLUMNS if c in page_df.columns]].copy()
+    if 'Image URL' in page_df.columns:
+        summary.insert(0, "📷", page_df['Image URL'].map(image_thumbnail_src))
+    selection = st.dataframe(
+        summary,
+        hide_index=True,
+        use_container_width=True,
+        column_config={"📷": st.column_config.ImageColumn("📷", width="small")},
+        on_select="rerun",
+        selection_mode="multi-row",
+        # A new version after a bulk action clears the selection
+        key="ticket_table_" + "_".join(
+            str(part) for part in filter_key + (page, page_size, st.session_state.get('ticket_table_version', 0)) if part
+        )
+    )
+    
+    # Pagination controls
+    col_prev, col_info, col_next, col_size = st.columns([1, 2, 1, 1])
+    with col_prev:
+        if st.button("◀ Previous", disabled=page <= 1, use_container_width=True):
+            st.session_state.tickets_page = page - 1
+            st.rerun()
+    with col_info:
+        st.markdown(
+            f"<p style='text-align: center; margin-top: 0.6rem;'>Page {page} of {page_count} "
+            f"({start + 1}–{start + len(page_df)} of {total})</p>",
+            unsafe_allow_html=True
+        )
+    with col_next:
+        if st.button("Next ▶", disabled=page >= page_count, use_container_width=True):
+            st.session_state.tickets_page = page + 1
+            st.rerun()
+    with col_size:
+        new_page_size = st.selectbox(
+            "Tickets per page",
+            TICKET_PAGE_SIZES,
+            index=TICKET_PAGE_SIZES.index(page_size),
+            label_visibility="collapsed"
+        )
+        if new_page_size != page_size:
+            st.session_state.tickets_page_size = new_page_size
+            st.session_state.tickets_page = start // new_page_size + 1
+            st.rerun()
+    
+    # Full details and the close form are only built for the selected ticket
+    selected_rows = selection.selection.rows if selection else []
+    if not selected_rows:
+        st.caption("Select a ticket in the table to see its details, or several to close or reassign them together.")
+        return
+    
+    if len(selected_rows) > 1:
+        st.markdown("---")
+        filters = {
+            'status': None if status_filter == "All" else status_filter,
+            'ticket_ids': ticket_ids,
+            'include_archived': include_archived,
+        }
+        render_bulk_actions(ticket_type, page_df.iloc[selected_rows], filters, total)
+        return
+    
+    selected_id = page_df['Ticket ID'].iloc[selected_rows[0]]
+    selected_df, _ = query_tickets(ticket_type, ticket_ids=[selected_id], include_archived=include_archived)
+    if selected_df.empty:
+        return
     
     st.markdown("---")
-    st.markdown(f"### Showing {len(df)} {status_filter if status_filter != 'All' else ''} Ticket(s)")
+    render_ticket_detail(selected_df.iloc[0], ticket_type)
+
+def render_bulk_actions(ticket_type, selected_df, filters, total):
+    """Close or reassign the selected tickets (or all matching ones) with one batched write"""
+    st.markdown(f"**🧰 Bulk Actions: {len(selected_df)} ticket(s) selected**")
+    with st.form(f"bulk_form_{ticket_type}"):
+        apply_all = False
+        if total > len(selected_df):
+            apply_all = st.checkbox(f"Apply to all {total} ticket(s) matching the current filters")
+        action = st.radio("Action", ["Close", "Reassign"], horizontal=True)
+        action_taken = st.text_area(
+            "Action Taken (when closing)",
+            help="Recorded on every ticket that gets closed",
+            height=100
+        )
+        assignee = st.selectbox(
+            "Assign To (when reassigning)",
+            list(IT_STAFF),
+            format_func=lambda username: IT_STAFF[username]['name']
+        )
+        submitted = st.form_submit_button("✅ Apply to Tickets", use_container_width=True)
+    
+    if not submitted:
+        return
+    if apply_all:
+        selected_df, _ = query_tickets(ticket_type, columns=["Ticket ID", "Status"], **filters)
+    
+    if action == "Close":
+        if not action_taken.strip():
+            st.error("❌ Please provide action taken details before closing the tickets.")
+            return
+        open_ids = list(selected_df.loc[selected_df['Status'] == 'Open', 'Ticket ID'])
+        if not open_ids:
+            st.warning("None of the selected tickets are open.")
+            return
+        updated = close_tickets(ticket_type, open_ids, st.session_state.username, action_taken)
+        message = f"✅ Closed {updated} ticket(s)"
+    else:
+        updated = reassign_tickets(ticket_type, list(selected_df['Ticket ID']), assignee)
+        message = f"✅ Assigned {updated} ticket(s) to {IT_STAFF[assignee]['name']}"
     
-    # Display tickets
-    for idx, row in df.iterrows():
-        status_class = "status-open" if row['Status'] == 'Open' else "status-closed"
+    if updated is not None:
+        st.session_state.tickets_message = message
+        st.session_state.ticket_table_version = st.session_state.get('ticket_table_version', 0) + 1
+        st.rerun()
+
+def render_ticket_import(ticket_type):
+    """Bulk import tickets of one type from a CSV or Excel file"""
+    with st.expander(f"📥 Import {ticket_type} Tickets from CSV/Excel"):
+        st.caption(
+            "Use the worksheet's column names as the header row. Type of Query, SS/DB/DP Name, "
+            "Incident Category, Subject and Call Received From are required; tickets without "
+            "a Ticket ID get a new one, and Status defaults to Open."
+        )
+        # A new version after an import clears the uploader, so the file can't be imported twice
+        version = st.session_state.get('import_version', 0)
+        uploaded_file = st.file_uploader("Ticket file", type=['csv', 'xlsx'], key=f"import_file_{ticket_type}_{version}")
+        if uploaded_file is None:
+            return
+        
+        try:
+            df = read_ticket_import(uploaded_file)
+        except Exception as e:
+            st.error(f"Error reading {uploaded_file.name}: {e}")
+            return
         
-        # Check if image exists
-        has_image = 'Image URL' in row and row['Image URL'] and str(row['Image URL']).strip()
+        tickets, errors = prepare_ticket_import(ticket_type, df)
+        for error in errors[:20]:
+            st.warning(error)
+        if len(errors) > 20:
+            st.warning(f"...and {len(errors) - 20} more row(s) skipped")
+        if not tickets:
+            return
         
-        with st.expander(f"🎫 {row['Ticket ID']} - {row['Incident Category']} - {row['Received Date']} {'📷' if has_image else ''}"):
-            # Status badge
-            st.markdown(f"<span class='{status_class}'>{row['Status']}</span>", unsafe_allow_html=True)
-            st.markdown("---")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**📋 Ticket Information**")
-                st.markdown(f"**Type of Query:** {row['Type of Query']}")
-                st.markdown(f"**SS/DB/DP Name:** {row['SS/DB/DP Name']}")
-                st.markdown(f"**SS/DB/DP Code:** {row['SS/DB/DP Code'] if row['SS/DB/DP Code'] else 'N/A'}")
-                st.markdown(f"**City:** {row['City'] if row['City'] else 'N/A'}")
-                st.markdown(f"**State:** {row['State'] if row['State'] else 'N/A'}")
-                st.markdown(f"**Incident Category:** {row['Incident Category']}")
-                st.markdown(f"**Call Received From:** {row['Call Received From']}")
-            
-            with col2:
-                st.markdown("**📅 Timeline**")
-                st.markdown(f"**Received Date:** {row['Received Date']}")
-                st.markdown(f"**Received Time:** {row['Received Time']}")
-                if row['Status'] == 'Closed':
-                    st.markdown("---")
-                    st.markdown("**✅ Closure Information**")
-                    st.markdown(f"**IT Member:** {row['IT Member Assigned']}")
-                    st.markdown(f"**Closing Date:** {row['Closing Date']}")
-                    st.markdown(f"**Closing Time:** {row['Closing Time']}")
-            
+        st.info(f"{len(tickets)} ticket(s) ready to import")
+        if st.button(f"📥 Import {len(tickets)} Ticket(s)", key=f"import_button_{ticket_type}"):
+            imported = import_tickets(ticket_type, tickets)
+            if imported is not None:
+                st.session_state.tickets_message = f"✅ Imported {imported} {ticket_type} ticket(s)"
+                st.session_state.import_version = version + 1
+                st.rerun()
+
+def render_outbox_status():
+    """Show how many submitted tickets are still waiting to reach Google Sheets"""
+    if storage_backend() != 'sheets':
+        return
+    
+    outbox = get_outbox_status()
+    if outbox['failed_attachments']:
+        with st.expander(f"⚠️ {outbox['failed_attachments']} attachment(s) could not be uploaded to Google Drive"):
+            st.caption("These tickets were saved without their image; the files are kept on the server.")
+            st.dataframe(get_failed_attachments(), use_container_width=True, hide_index=True)
+    if outbox['depth'] == 0:
+        st.caption("🔄 Sync queue: all submitted tickets are in Google Sheets")
+        return
+    
+    message = (f"🔄 {outbox['depth']} submitted ticket(s) waiting to sync to Google Sheets "
+               f"(oldest {outbox['lag_seconds']:.0f}s ago)")
+    if outbox['last_error']:
+        st.warning(f"{message}. Last error: {outbox['last_error']}")
+    else:
+        st.info(message)
+
+def render_mirror_status():
+    """Show how far the local tickets are ahead of (or behind) Google Sheets in mirror mode"""
+    if storage_backend() != 'mirror':
+        return
+    
+    mirror = get_mirror_status()
+    if mirror['synced_at'] is None:
+        last_sync = "never synced"
+    else:
+        last_sync = f"last synced {datetime.fromtimestamp(mirror['synced_at']).strftime('%Y-%m-%d %H:%M:%S')}"
+    if mirror['last_error']:
+        st.warning(f"🔄 {mirror['pending']} local change(s) waiting to sync to Google Sheets ({last_sync}). "
+                   f"Last error: {mirror['last_error']}")
+    elif mirror['pending']:
+        st.info(f"🔄 {mirror['pending']} local change(s) waiting to sync to Google Sheets "
+                f"(oldest {mirror['lag_seconds']:.0f}s ago, {last_sync})")
+    else:
+        st.caption(f"🔄 Google Sheets mirror: up to date ({last_sync})")
+
+def drive_file_id(url):
+    """Extract the file ID from a Google Drive link, or None"""
+    match = re.search(r"/d/([\w-]+)|[?&]id=([\w-]+)", url)
+    return (match.group(1) or match.group(2)) if match else None
+
+def image_thumbnail_src(image_url):
+    """Thumbnail for the ticket list as a data URI, or None if unavailable
+
+    Local and Drive thumbnails alike come from the server-side image
+    cache, so the browser needs no Google sign-in and repeated page views
+    don't touch Drive.
+    """
+    image_url = str(image_url).strip() if isinstance(image_url, str) else ''
+    if not image_url:
+        return None
+    
+    try:
+        thumbnail = load_attachment_image(image_url, 'thumb')
+    except Exception as e:
+        _handle_google_error(e)
+        logger.warning("Could not load the thumbnail of %s: %s", image_url, e)
+        return None
+    if thumbnail is None:
+        return None
+    return "data:image/jpeg;base64," + base64.b64encode(thumbnail).decode()
+
+@st.cache_resource(show_spinner=False)
+def _image_cache():
+    """Process-wide LRU cache of decoded and resized attachment images"""
+    return {
+        'entries': collections.OrderedDict(),
+        'size': 0,
+        'lock': threading.Lock(),
+    }
+
+def _cached_image(key, loader):
+    """Get image bytes from the LRU cache, calling loader() on a miss"""
+    cache = _image_cache()
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            record_cache_access('image', True)
+            return cache['entries'][key]
+    
+    record_cache_access('image', False)
+    data = loader()
+    if data is None:
+        return None
+    
+    with cache['lock']:
+        if key not in cache['entries']:
+            cache['entries'][key] = data
+            cache['size'] += len(data)
+        # Evict least recently used images until we're back under budget
+        while cache['size'] > IMAGE_CACHE_MAX_BYTES and len(cache['entries']) > 1:
+            _, evicted = cache['entries'].popitem(last=False)
+            cache['size'] -= len(evicted)
+    return data
+
+@timed
+def load_attachment_image(image_url, variant):
+    """Get JPEG bytes of an attachment's 'thumb' or 'web' version, or None if unavailable
+
+    Local images are cached by path and modification time; Drive images
+    are fetched server-side once and cached by file ID.
+    """
+    if image_url.startswith('local://'):
+        local_path = image_url.replace('local://', '')
+        if not os.path.exists(local_path):
+            return None
+        key = ('local', local_path, os.path.getmtime(local_path), variant)
+        return _cached_image(key, lambda: _load_local_image_variant(local_path, variant))
+    
+    file_id = drive_file_id(image_url)
+    if file_id is None:
+        return None
+    return _cached_image(('drive', file_id, variant), lambda: _fetch_drive_image_variant(file_id, variant))
+
+def _load_local_image_variant(local_path, variant):
+    """Read a stored image variant, creating it from the original if it is missing"""
+    variant_path = image_variant_path(local_path, variant)
+    if os.path.exists(variant_path):
+        with open(variant_path, "rb") as f:
+            return f.read()
+    
+    # Attachments saved before variants existed
+    with open(local_path, "rb") as f:
+        return make_image_variants(f).get(variant)
+
+def _fetch_drive_image_variant(file_id, variant):
+    """Download an image variant from Drive via the variant IDs on the original"""
+    pool = _get_google_client_pool()
+    if pool is None:
+        return None
+    
+    drive_service = pool['drive_service']
+    with _drive_lock():
+        original = google_request('drive', 'files.get', drive_service.files().get(fileId=file_id, fields='appProperties').execute)
+        variant_id = original.get('appProperties', {}).get(f"{variant}_file_id")
+        if variant_id:
+            return google_request('drive', 'files.get_media', drive_service.files().get_media(fileId=variant_id).execute)
+        
+        # Uploaded before variants existed: resize the original here
+        data = google_request('drive', 'files.get_media', drive_service.files().get_media(fileId=file_id).execute)
+    return make_image_variants(io.BytesIO(data)).get(variant)
+
+@timed
+def render_ticket_detail(row, ticket_type):
+    """Show the full details of one ticket, with a close form if it is open"""
+    status_class = "status-open" if row['Status'] == 'Open' else "status-closed"
+    
+    # Check if image exists
+    has_image = 'Image URL' in row and row['Image URL'] and str(row['Image URL']).strip()
+    
+    st.markdown(f"#### 🎫 {row['Ticket ID']} - {row['Incident Category']} - {row['Received Date']} {'📷' if has_image else ''}")
+    # Status badge
+    st.markdown(f"<span class='{status_class}'>{row['Status']}</span>", unsafe_allow_html=True)
+    st.markdown("---")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("**📋 Ticket Information**")
+        st.markdown(f"**Type of Query:** {row['Type of Query']}")
+        st.markdown(f"**SS/DB/DP Name:** {row['SS/DB/DP Name']}")
+        st.markdown(f"**SS/DB/DP Code:** {row['SS/DB/DP Code'] if row['SS/DB/DP Code'] else 'N/A'}")
+        st.markdown(f"**City:** {row['City'] if row['City'] else 'N/A'}")
+        st.markdown(f"**State:** {row['State'] if row['State'] else 'N/A'}")
+        st.markdown(f"**Incident Category:** {row['Incident Category']}")
+        st.markdown(f"**Call Received From:** {row['Call Received From']}")
+    
+    with col2:
+        st.markdown("**📅 Timeline**")
+        st.markdown(f"**Received Date:** {row['Received Date']}")
+        st.markdown(f"**Received Time:** {row['Received Time']}")
+        if row['Status'] == 'Closed':
             st.markdown("---")
-            st.markdown("**📝 Subject:**")
-            st.markdown(f"{row['Subject']}")
-            
-            # Display image if exists
-            if has_image:
-                st.markdown("---")
-                st.markdown("**📷 Attached Image:**")
-                image_url = str(row['Image URL']).strip()
-                
-                if image_url.startswith('local://'):
-                    # Local file
-                    local_path = image_url.replace('local://', '')
-                    if os.path.exists(local_path):
-                        try:
-                            st.image(local_path, caption="Ticket Image", use_container_width=True)
-                        except:
-                            st.error("Unable to load local image")
+            st.markdown("**✅ Closure Information**")
+            st.markdown(f"**IT Member:** {row['IT Member Assigned']}")
+            st.markdown(f"**Closing Date:** {row['Closing Date']}")
+            st.markdown(f"**Closing Time:** {row['Closing Time']}")
+    
+    st.markdown("---")
+    st.markdown("**📝 Subject:**")
+    st.markdown(f"{row['Subject']}")
+    
+    # Display image if exists
+    if has_image:
+        st.markdown("---")
+        st.markdown("**📷 Attached Image:**")
+        image_url = str(row['Image URL']).strip()
+    
+        if not image_url.startswith('local://'):
+            st.markdown(f"[🔗 View Image in Browser]({image_url})")
+        
+        # Thumbnail first; the web-optimized version only when asked for
+        show_full = st.toggle("🔍 Show full image", key=f"full_img_{row['Ticket ID']}")
+        variant = 'web' if show_full else 'thumb'
+        try:
+            image_bytes = load_attachment_image(image_url, variant)
+        except Exception as e:
+            _handle_google_error(e)
+            image_bytes = None
+        
+        if image_bytes is None:
+            st.warning("Unable to load image preview")
+        elif show_full:
+            st.image(image_bytes, caption="Ticket Image", use_container_width=True)
+        else:
+            st.image(image_bytes, caption="Ticket Image (thumbnail)", width=IMAGE_VARIANTS['thumb'][0])
+    
+    if row['Status'] == 'Closed':
+        st.markdown("---")
+        st.markdown("**✔️ Action Taken:**")
+        st.markdown(f"{row['Action Taken']}")
+    
+    if storage_backend() == 'mirror':
+        with st.expander("🕘 Change History"):
+            changes = get_ticket_changes(ticket_type, row['Ticket ID'])
+            if changes.empty:
+                st.caption("No changes recorded")
+            else:
+                changes['field'] = changes['field'].replace('', 'Ticket created')
+                changes['source'] = changes['source'].map({'local': 'Portal', 'sheet': 'Google Sheets'})
+                changes['changed_at'] = changes['changed_at'].map(lambda t: datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S'))
+                changes['synced'] = changes['synced_at'].notna()
+                st.dataframe(
+                    changes[['changed_at', 'source', 'field', 'old_value', 'new_value', 'synced']].rename(columns={
+                        'changed_at': 'Changed At', 'source': 'Source', 'field': 'Field',
+                        'old_value': 'Old Value', 'new_value': 'New Value', 'synced': 'Synced',
+                    }),
+                    hide_index=True,
+                    use_container_width=True
+                )
+    
+    # Close ticket option for open tickets
+    if row['Status'] == 'Open':
+        st.markdown("---")
+        st.markdown("**🔧 Close This Ticket**")
+        with st.form(f"close_form_{row['Ticket ID']}"):
+            action_taken = st.text_area(
+                "Action Taken *", 
+                key=f"action_{row['Ticket ID']}",
+                help="Describe the action taken to resolve this ticket",
+                height=100
+            )
+        
+            if st.form_submit_button("✅ Close Ticket", use_container_width=True):
+                if action_taken.strip():
+                    if close_ticket(
+                        ticket_type,
+                        row['Ticket ID'],
+                        st.session_state.username,
+                        action_taken
+                    ):
+                        st.success("✅ Ticket closed successfully!")
+                        st.rerun()
                     else:
-                        st.warning("Local image file not found")
+                        st.error("❌ Failed to close ticket. Please try again.")
                 else:
-                    # Google Drive link
-                    col_img1, col_img2 = st.columns([3, 1])
-                    with col_img1:
-                        st.markdown(f"[🔗 View Image in Browser]({image_url})")
-                    with col_img2:
-                        if st.button("👁️ Show Preview", key=f"img_{row['Ticket ID']}"):
-                            # Extract file ID from Google Drive URL and display
-                            try:
-                                # Convert view link to direct image link
-                                if 'drive.google.com' in image_url:
-                                    # Try to display using iframe
-                                    st.markdown(f'<iframe src="{image_url}" width="100%" height="400"></iframe>', unsafe_allow_html=True)
-                            except:
-                                st.info("Click the link above to view the image")
-            
-            if row['Status'] == 'Closed':
-                st.markdown("---")
-                st.markdown("**✔️ Action Taken:**")
-                st.markdown(f"{row['Action Taken']}")
-            
-            # Close ticket option for open tickets
-            if row['Status'] == 'Open':
-                st.markdown("---")
-                st.markdown("**🔧 Close This Ticket**")
-                with st.form(f"close_form_{row['Ticket ID']}"):
-                    action_taken = st.text_area(
-                        "Action Taken *", 
-                        key=f"action_{row['Ticket ID']}",
-                        help="Describe the action taken to resolve this ticket",
-                        height=100
-                    )
-                    
-                    if st.form_submit_button("✅ Close Ticket", use_container_width=True):
-                        if action_taken.strip():
-                            if update_ticket_in_sheets(
-                                row['Ticket ID'],
-                                ticket_type,
-                                st.session_state.username,
-                                action_taken
-                            ):
-                                st.success("✅ Ticket closed successfully!")
-                                st.rerun()
-                            else:
-                                st.error("❌ Failed to close ticket. Please try again.")
-                        else:
-                            st.error("❌ Please provide action taken details before closing the ticket.")
+                    st.error("❌ Please provide action taken details before closing the ticket.")
+
+@timed
+def dashboard_page():
+    """Page for IT staff with resolution times, backlog aging and breakdowns"""
+    st.markdown("<h1 class='main-header'>Ticket Dashboard</h1>", unsafe_allow_html=True)
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        type_filter = st.radio("Ticket Type", ["All"] + TICKET_TYPES, horizontal=True, key="dashboard_type")
+    with col2:
+        today = datetime.now().date()
+        date_range = st.date_input(
+            "Received between",
+            value=(today.replace(day=1), today),
+            key="dashboard_dates"
+        )
+    
+    # The date picker returns one date while the user is still choosing the range
+    if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
+        st.info("Select a start and end date.")
+        return
+    start_date, end_date = date_range
+    
+    include_archived = st.checkbox("Include archived tickets", key="dashboard_archived")
+    
+    ticket_types = TICKET_TYPES if type_filter == "All" else [type_filter]
+    versions = tuple(get_ticket_snapshot(t)['version'] for t in ticket_types)
+    archive_key = archive_version() if include_archived else None
+    # Aging is measured against the current hour so the memoized result stays valid for it
+    as_of = pd.Timestamp.now().floor('h')
+    if 0 in versions:
+        # Fallback snapshots (version 0) are rebuilt on every read, so don't memoize them
+        stats = _compute_dashboard_stats.__wrapped__(tuple(ticket_types), versions, archive_key, start_date, end_date, as_of)
+    else:
+        stats = _compute_dashboard_stats(tuple(ticket_types), versions, archive_key, start_date, end_date, as_of)
+    
+    if stats is None:
+        st.info("📭 No tickets found.")
+        return
+    if stats['total'] == 0:
+        st.info("📭 No tickets received in this period.")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Tickets Received", stats['total'])
+    with col2:
+        st.metric("Open", stats['open'])
+    with col3:
+        st.metric("Closed", stats['closed'])
+    with col4:
+        median = stats['median_resolution_hours']
+        st.metric("Median Resolution", "-" if pd.isna(median) else f"{median:.1f} h")
+    
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("#### ⏱️ Resolution Time")
+        st.bar_chart(stats['resolution'])
+        if not pd.isna(stats['p90_resolution_hours']):
+            st.caption(f"90% of closed tickets were resolved within {stats['p90_resolution_hours']:.1f} hours")
+    with col2:
+        st.markdown("#### 📬 Open Backlog Age")
+        st.bar_chart(stats['backlog'])
+    
+    st.markdown("---")
+    st.markdown("#### 📊 Breakdown")
+    breakdown_tabs = st.tabs(list(stats['breakdowns']))
+    for tab, table in zip(breakdown_tabs, stats['breakdowns'].values()):
+        with tab:
+            st.dataframe(table, use_container_width=True)
+
+def _bucket_counts(hours, buckets):
+    """Count values per (label, upper bound) bucket, keeping bucket order"""
+    labels = [label for label, _ in buckets]
+    bins = [-float('inf')] + [bound for _, bound in buckets]
+    counts = pd.cut(hours.dropna(), bins=bins, labels=labels, right=False).value_counts()
+    return counts.reindex(labels, fill_value=0).rename("Tickets")
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _compute_dashboard_stats(ticket_types, versions, archive_key, start_date, end_date, as_of):
+    """Dashboard aggregates for tickets received in a date range, or None if there are no tickets
+
+    Memoized per snapshot version: `ticket_types`, their snapshot
+    `versions` and `archive_key` (None, or the archive version when
+    archived tickets are included) identify the data, so the snapshots
+    are only read, filtered and combined on a miss.
+    """
+    frames = [get_tickets(t) for t in ticket_types]
+    if archive_key is not None:
+        # Only the archived months inside the date range are read
+        frames += [
+            get_archived_tickets(t, start_date.strftime('%Y-%m'), end_date.strftime('%Y-%m'))
+            for t in ticket_types
+        ]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return None
+    
+    # Cut each frame down to the date range before combining them
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    frames = [f[(f['Received At'] >= start) & (f['Received At'] < end)] for f in frames]
+    df = frames[0] if len(frames) == 1 else concat_tickets(frames)
+    received = df['Received At']
+    
+    is_open = df['Status'] == 'Open'
+    is_closed = df['Status'] == 'Closed'
+    resolution_hours = (df['Closed At'] - received).dt.total_seconds().div(3600).where(is_closed)
+    backlog_hours = (as_of - received).dt.total_seconds().div(3600).where(is_open)
+    
+    members = df['IT Member Assigned'].astype(str).str.strip()
+    frame = pd.DataFrame({
+        'Incident Category': df['Incident Category'],
+        'IT Member': members.where(members != '', 'Unassigned'),
+        'State': df['State'],
+        'City': df['City'],
+        'Open': is_open,
+        'Closed': is_closed,
+        'Resolution (h)': resolution_hours,
+    })
+    
+    breakdowns = {}
+    for column in ['Incident Category', 'IT Member', 'State', 'City']:
+        grouped = frame.groupby(column, sort=False, observed=True)
+        table = pd.DataFrame({
+            'Tickets': grouped.size(),
+            'Open': grouped['Open'].sum(),
+            'Closed': grouped['Closed'].sum(),
+            'Median Resolution (h)': grouped['Resolution (h)'].median().round(1),
+        })
+        if column == 'Incident Category':
+            known = [c for c in INCIDENT_CATEGORIES if c in table.index]
+            table = table.reindex(known + [c for c in table.index if c not in INCIDENT_CATEGORIES])
+        else:
+            table = table.sort_values('Tickets', ascending=False)
+        breakdowns[column] = table
+    
+    return {
+        'total': len(df),
+        'open': int(is_open.sum()),
+        'closed': int(is_closed.sum()),
+        'median_resolution_hours': resolution_hours.median(),
+        'p90_resolution_hours': resolution_hours.quantile(0.9),
+        'resolution': _bucket_counts(resolution_hours, RESOLUTION_BUCKETS),
+        'backlog': _bucket_counts(backlog_hours, BACKLOG_AGE_BUCKETS),
+        'breakdowns': breakdowns,
+    }
+
+def render_performance_panel():
+    """Admin sidebar panel with rerun timings, API call counts and cache hit rates"""
+    with st.expander("📈 Performance"):
+        last_rerun = st.session_state.get('perf_last_rerun')
+        if last_rerun:
+            st.markdown(f"**Last rerun:** {last_rerun['total_ms']:.0f} ms")
+            spans = pd.DataFrame(
+                [(name, span['count'], span['total_ms']) for name, span in last_rerun['spans'].items()],
+                columns=["Span", "Calls", "ms"]
+            )
+            st.dataframe(spans, hide_index=True, use_container_width=True)
+        
+        session_calls = st.session_state.get('perf_session_api_calls', collections.Counter())
+        st.markdown(f"**Google API calls this session:** {sum(session_calls.values())}")
+        
+        snapshot = metrics_snapshot()
+        if snapshot['caches']:
+            st.markdown("**Cache hit rates**")
+            caches = pd.DataFrame(
+                [(name, c['hits'], c['misses'], f"{c['hit_rate']:.0%}") for name, c in snapshot['caches'].items()],
+                columns=["Cache", "Hits", "Misses", "Hit rate"]
+            )
+            st.dataframe(caches, hide_index=True, use_container_width=True)
+        if snapshot['google_api']:
+            st.markdown("**Google API (this server)**")
+            api = pd.DataFrame.from_dict(snapshot['google_api'], orient='index')
+            st.dataframe(api[['calls', 'errors', 'retries', 'coalesced', 'avg_ms', 'max_ms']], use_container_width=True)
+        
+        st.download_button("⬇️ Prometheus metrics", metrics_prometheus(), file_name="metrics.prom", mime="text/plain")
+        st.download_button("⬇️ JSON metrics", json.dumps(snapshot, indent=2), file_name="metrics.json", mime="application/json")
 
 def main():
-    """Main application"""
+    """Main application, measured as one rerun"""
+    begin_rerun_metrics()
+    try:
+        render_app()
+    finally:
+        end_rerun_metrics()
+
+def render_app():
+    """Sidebar navigation and the selected page"""
+    
+    # Flush tickets queued by earlier runs as soon as the server starts
+    # (the worker also runs the scheduled archival, in local mode too)
+    start_outbox_worker()
     
     # Sidebar navigation
     with st.sidebar:
@@ -713,7 +4373,29 @@ def main():
             st.markdown("**Role:** IT Staff")
             st.markdown("---")
             
-            page = st.radio("Navigation", ["View Tickets", "Submit New Ticket"])
+            page = st.radio("Navigation", ["View Tickets", "Dashboard", "Submit New Ticket"])
+            
+            if st.session_state.username == 'admin':
+                st.markdown("---")
+                st.markdown("**🛠️ Maintenance**")
+                if st.button("🧹 Remove Unused Attachments"):
+                    removed = collect_orphan_attachments()
+                    if removed is None:
+                        st.error("Could not read every ticket, so no attachments were removed. Try again later.")
+                    else:
+                        st.success(f"Removed {removed} unused attachment(s)")
+                if ARCHIVE_AFTER_DAYS > 0 and st.button("📦 Archive Old Closed Tickets"):
+                    moved = archive_closed_tickets()
+                    st.success(f"Archived {sum(moved.values())} ticket(s) closed more than {ARCHIVE_AFTER_DAYS} days ago")
+                mirrored = storage_backend() == 'mirror' and _get_google_client_pool() is not None
+                if mirrored and st.button("🔄 Sync with Google Sheets Now"):
+                    run_ticket_mirror(force=True)
+                    mirror = get_mirror_status()
+                    if mirror['last_error']:
+                        st.error(f"Sync failed: {mirror['last_error']}")
+                    else:
+                        st.success("Synced with Google Sheets")
+                render_performance_panel()
             
             st.markdown("---")
             if st.button("🚪 Logout"):
@@ -734,6 +4416,8 @@ def main():
     if st.session_state.logged_in:
         if page == "View Tickets":
             view_tickets_page()
+        elif page == "Dashboard":
+            dashboard_page()
         else:
             submit_ticket_page()
     else:
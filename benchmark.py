@@ -0,0 +1,672 @@
+"""Benchmark the ticket storage paths against an in-memory Google Sheets/Drive stand-in
+
+Runs submit, list, filter, search and close workloads at several ticket
+counts against the Google Sheets store (with a fake gspread worksheet and
+Drive service) and the local SQLite store (and optionally the CSV store),
+plus a concurrent-submit workload that checks ticket IDs stay unique. Reports throughput, p50/p99
+latency and peak traced memory per workload.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 1000 10000 --latency 0.05 --quota-error-rate 0.02
+    python benchmark.py --output results.json
+
+The JSON output records the git commit, so runs on different commits can
+be compared.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import gspread
+import httplib2
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+from googleapiclient.errors import HttpError
+
+import streamlit.logger
+
+# Importing the app outside `streamlit run` logs a warning for every st.* call
+streamlit.logger.set_log_level("error")
+
+import app  # noqa: E402
+
+# Retries of injected quota errors are expected; only real failures are worth printing
+logging.getLogger("nilons_ticketing").setLevel(logging.ERROR)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Operations per workload
+DEFAULT_OPS = {
+    'submit': 200,
+    'list_full': 5,
+    'list': 50,
+    'filter': 50,
+    'search': 50,
+    'close': 200,
+}
+SEARCH_TERMS = ["stock", "mismatch", "login", "ora", "invoice", "db12", "pune", "tally sync"]
+SUBJECT_WORDS = ["stock", "mismatch", "login", "failed", "ORA-01555", "invoice", "GRN", "tally",
+                 "sync", "error", "scheme", "report", "billing", "order", "delivery"]
+CITIES = [("Pune", "Maharashtra"), ("Nagpur", "Maharashtra"), ("Surat", "Gujarat"),
+          ("Indore", "Madhya Pradesh"), ("Jaipur", "Rajasthan")]
+
+
+# ---------------------------------------------------------------------------
+# In-memory Google stand-in
+# ---------------------------------------------------------------------------
+
+class FakeGoogle:
+    """Shared settings and counters for the fake Sheets and Drive services"""
+
+    def __init__(self, latency=0.0, quota_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.quota_errors = 0
+        self.lock = threading.Lock()
+
+    def request(self, write=False):
+        """Simulate one API round trip: latency, and a 429 at the configured rate"""
+        with self.lock:
+            self.calls += 1
+            fail = self.random.random() < self.quota_error_rate
+            if fail:
+                self.quota_errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise gspread.exceptions.APIError(_QuotaResponse())
+
+    def drive_request(self):
+        """Like request(), but failing the way the Drive client does"""
+        try:
+            self.request()
+        except gspread.exceptions.APIError:
+            raise HttpError(httplib2.Response({'status': 429}), b'{"error": {"code": 429}}')
+
+
+class _QuotaResponse:
+    """Just enough of a requests.Response for gspread's APIError"""
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {'error': {'code': 429, 'message': self.text, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeWorksheet:
+    """In-memory stand-in for gspread.Worksheet (values are stored as strings)"""
+
+    def __init__(self, google, sheet_id, title):
+        self.google = google
+        self.id = sheet_id
+        self.title = title
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def _range(self, a1_range):
+        grid = a1_range_to_grid_range(a1_range)
+        start_row = grid.get('startRowIndex', 0)
+        end_row = grid.get('endRowIndex', len(self.rows))
+        start_col = grid.get('startColumnIndex', 0)
+        end_col = grid.get('endColumnIndex', len(app.SHEET_HEADERS))
+        values = [list(row[start_col:end_col]) for row in self.rows[start_row:end_row]]
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    def _write(self, a1_range, values):
+        row_num, col = a1_to_rowcol(a1_range.split(':')[0])
+        for offset, row_values in enumerate(values):
+            while len(self.rows) < row_num + offset:
+                self.rows.append([])
+            row = self.rows[row_num + offset - 1]
+            while len(row) < col - 1 + len(row_values):
+                row.append('')
+            for i, value in enumerate(row_values):
+                row[col - 1 + i] = str(value)
+
+    def get_all_values(self, **kwargs):
+        self.google.request()
+        with self.lock:
+            return [list(row) for row in self.rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self.google.request()
+        with self.lock:
+            return [self._range(a1_range) for a1_range in ranges]
+
+    def row_values(self, row_num, **kwargs):
+        self.google.request()
+        with self.lock:
+            return list(self.rows[row_num - 1]) if len(self.rows) >= row_num else []
+
+    def col_values(self, col, **kwargs):
+        self.google.request()
+        with self.lock:
+            return [row[col - 1] if len(row) >= col else '' for row in self.rows]
+
+    def append_row(self, values, **kwargs):
+        self.google.request(write=True)
+        with self.lock:
+            self.rows.append([str(value) for value in values])
+            row_num = len(self.rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{row_num}:Q{row_num}"}}
+
+    def append_rows(self, values, **kwargs):
+        self.google.request(write=True)
+        with self.lock:
+            first_row = len(self.rows) + 1
+            self.rows.extend([str(value) for value in row] for row in values)
+            last_row = len(self.rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{first_row}:Q{last_row}"}}
+
+    def batch_update(self, data, **kwargs):
+        self.google.request(write=True)
+        with self.lock:
+            for update in data:
+                self._write(update['range'], update['values'])
+
+
+class FakeSpreadsheet:
+    """In-memory stand-in for gspread.Spreadsheet"""
+    id = 'benchmark'
+
+    def __init__(self, google):
+        self.google = google
+        self.sheets = {}
+
+    def worksheet(self, title):
+        self.google.request()
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.google.request()
+        return list(self.sheets.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self.google.request(write=True)
+        self.sheets[title] = FakeWorksheet(self.google, len(self.sheets) + 1, title)
+        return self.sheets[title]
+
+    def batch_update(self, body):
+        self.google.request(write=True)
+        by_id = {sheet.id: sheet for sheet in self.sheets.values()}
+        for request in body['requests']:
+            dimension = request['deleteDimension']['range']
+            sheet = by_id[dimension['sheetId']]
+            with sheet.lock:
+                del sheet.rows[dimension['startIndex']:dimension['endIndex']]
+
+
+class FakeClient:
+    """In-memory stand-in for gspread.Client"""
+
+    def __init__(self, google):
+        self.spreadsheet = FakeSpreadsheet(google)
+
+    def open(self, name):
+        self.spreadsheet.google.request()
+        return self.spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.google.request()
+        return self.spreadsheet
+
+
+class _FakeDriveRequest:
+    """A prepared Drive request; execute() runs it"""
+
+    def __init__(self, google, run):
+        self.google = google
+        self.run = run
+
+    def execute(self, **kwargs):
+        self.google.drive_request()
+        return self.run()
+
+
+class FakeDrive:
+    """In-memory stand-in for the Drive v3 files and permissions resources"""
+
+    def __init__(self, google):
+        self.google = google
+        self.files_by_id = {}
+
+    def files(self):
+        return _FakeDriveFiles(self)
+
+    def permissions(self):
+        return _FakeDrivePermissions(self)
+
+
+class _FakeDriveFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q=None, fields=None, **kwargs):
+        def run():
+            files = [
+                {'id': file_id, 'name': f['name'], 'appProperties': f.get('appProperties', {}),
+                 'webViewLink': f"https://drive.google.com/file/d/{file_id}/view"}
+                for file_id, f in self.drive.files_by_id.items()
+                if f"'{f['name']}'" in (q or '')
+                or any(f"value='{value}'" in (q or '') for value in f.get('appProperties', {}).values())
+            ]
+            return {'files': files}
+        return _FakeDriveRequest(self.drive.google, run)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def run():
+            file_id = f"F{len(self.drive.files_by_id) + 1}"
+            data = b''
+            if media_body is not None:
+                stream = media_body.stream()
+                stream.seek(0)
+                data = stream.read()
+            self.drive.files_by_id[file_id] = dict(body, data=data)
+            return {'id': file_id, 'webViewLink': f"https://drive.google.com/file/d/{file_id}/view"}
+        return _FakeDriveRequest(self.drive.google, run)
+
+    def get(self, fileId=None, fields=None, **kwargs):
+        return _FakeDriveRequest(self.drive.google, lambda: {
+            'id': fileId, 'appProperties': self.drive.files_by_id[fileId].get('appProperties', {})
+        })
+
+    def get_media(self, fileId=None, **kwargs):
+        return _FakeDriveRequest(self.drive.google, lambda: self.drive.files_by_id[fileId]['data'])
+
+    def delete(self, fileId=None, **kwargs):
+        return _FakeDriveRequest(self.drive.google, lambda: self.drive.files_by_id.pop(fileId, None) and None)
+
+
+class _FakeDrivePermissions:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def create(self, fileId=None, body=None, **kwargs):
+        return _FakeDriveRequest(self.drive.google, lambda: {'id': 'anyoneWithLink'})
+
+
+def install_fake_google(google):
+    """Point the app's shared Google client pool at the fakes; returns the fake client"""
+    client = FakeClient(google)
+    pool = {
+        'credentials': None,
+        'client': client,
+        'drive_service': FakeDrive(google),
+        'spreadsheet': None,
+        'drive_folder_id': None,
+        'worksheets': {},
+        'sheets_lock': threading.RLock(),
+        'drive_lock': threading.RLock(),
+    }
+    app._get_google_client_pool = lambda: pool
+    return client
+
+
+def use_local_storage(backend='sqlite'):
+    """Make the app use a local ticket store, as if credentials.json were missing"""
+    app.STORAGE_BACKEND = backend
+    app._get_google_client_pool = lambda: None
+
+
+# ---------------------------------------------------------------------------
+# Data and state
+# ---------------------------------------------------------------------------
+
+def make_ticket(rng, ticket_id, received):
+    """A random ticket as the submit form produces it"""
+    city, state = rng.choice(CITIES)
+    return {
+        'ticket_id': ticket_id,
+        'type_of_query': rng.choice(["Query", "Issue", "Request"]),
+        'ss_db_dp_name': f"Distributor {rng.randint(1, 800)}",
+        'ss_db_dp_code': f"DB{rng.randint(1000, 9999)}",
+        'city': city,
+        'state': state,
+        'incident_category': rng.choice(app.INCIDENT_CATEGORIES),
+        'subject': " ".join(rng.sample(SUBJECT_WORDS, 5)),
+        'call_received_from': f"Caller {rng.randint(1, 300)}",
+        'received_date': received.strftime("%Y-%m-%d"),
+        'received_time': received.strftime("%H:%M:%S"),
+        'status': 'Open',
+        'it_member_assigned': '',
+        'closing_date': '',
+        'closing_time': '',
+        'action_taken': '',
+        'image_url': '',
+    }
+
+
+def make_history(rng, size):
+    """size existing tickets over the last year, about 60% of them closed"""
+    now = datetime.now()
+    tickets = []
+    for i in range(size):
+        received = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        ticket = make_ticket(rng, f"SAP-{received.strftime('%Y%m%d%H%M%S')}-B{i}", received)
+        if rng.random() < 0.6:
+            closed = received + timedelta(minutes=rng.randint(10, 7 * 24 * 60))
+            ticket.update(
+                status='Closed',
+                it_member_assigned=rng.choice([s['name'] for s in app.IT_STAFF.values()]),
+                closing_date=closed.strftime("%Y-%m-%d"),
+                closing_time=closed.strftime("%H:%M:%S"),
+                action_taken=f"Resolved {rng.choice(SUBJECT_WORDS)}",
+            )
+        tickets.append(ticket)
+    return tickets
+
+
+def reset_app_state(workdir):
+    """Give the app a fresh local database and empty process-wide caches"""
+    app.LOCAL_DB_FILE = os.path.join(workdir, 'local_tickets.db')
+    app.CSV_DIR = os.path.join(workdir, 'ticket_csv')
+    for cached in (app._ticket_snapshots, app._ticket_row_indexes, app._search_indexes,
+                   app._archive_cache, app._google_gateway, app._metrics, app._image_cache):
+        cached.clear()
+    # The stand-in has no quota; pacing would only measure the limiter
+    app.GOOGLE_RATE_LIMITS = {api: 10 ** 9 for api in app.GOOGLE_RATE_LIMITS}
+    app.GOOGLE_BURST = 10 ** 9
+
+
+def preload(backend, client, history):
+    """Store the history tickets in one go (directly in the fake sheet for Sheets)"""
+    if backend == 'sheets':
+        spreadsheet = client.spreadsheet
+        worksheet = spreadsheet.sheets.get("SAP Tickets")
+        if worksheet is None:
+            worksheet = FakeWorksheet(spreadsheet.google, 1, "SAP Tickets")
+            spreadsheet.sheets["SAP Tickets"] = worksheet
+        worksheet.rows = [list(app.SHEET_HEADERS)] + [
+            [ticket[field] for field in app.LOCAL_FIELDS] for ticket in history
+        ]
+    else:
+        app.get_ticket_store().append_many('SAP', history)
+
+
+# ---------------------------------------------------------------------------
+# Workloads
+# ---------------------------------------------------------------------------
+
+def submit_ticket(rng):
+    """One ticket submission: allocate an ID and store the row"""
+    ticket = make_ticket(rng, app.allocate_ticket_id('SAP'), datetime.now())
+    app.get_ticket_store().append('SAP', ticket)
+    return ticket['ticket_id']
+
+
+def list_page(full):
+    """Render-equivalent of the first View Tickets page (metrics plus one page of rows)"""
+    if full:
+        app.reset_ticket_cache('SAP')
+    else:
+        app.invalidate_ticket_cache('SAP')
+    app.ticket_status_counts('SAP')
+    app.query_tickets(
+        'SAP', sort_by="Received At", limit=25, columns=app.TICKET_SUMMARY_COLUMNS + ["Image URL"]
+    )
+
+
+def filter_page(rng):
+    """A filtered, sorted list view: status, category and the last 30 days"""
+    today = datetime.now().date()
+    app.query_tickets(
+        'SAP',
+        status=rng.choice(["Open", "Closed"]),
+        category=rng.choice(app.INCIDENT_CATEGORIES),
+        received_from=today - timedelta(days=30),
+        received_to=today,
+        sort_by="Received At",
+        descending=True,
+        limit=25,
+        columns=app.TICKET_SUMMARY_COLUMNS
+    )
+
+
+def close_ticket(ticket_id):
+    """Close one ticket the way the detail form does"""
+    if not app.get_ticket_store().close('SAP', ticket_id, "Benchmark", "Closed by benchmark"):
+        raise RuntimeError(f"Ticket {ticket_id} not found")
+
+
+def measure(name, operations, google=None):
+    """Run each operation once, timing it; returns the workload's result record"""
+    latencies = []
+    errors = 0
+    calls_before = google.calls if google else 0
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    for operation in operations:
+        op_started = time.perf_counter()
+        try:
+            operation()
+        except Exception as e:
+            errors += 1
+            logging.getLogger("benchmark").warning("%s failed: %s", name, e)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+
+    return {
+        'workload': name,
+        'ops': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(1000 * percentile(latencies, 50), 3),
+        'p99_ms': round(1000 * percentile(latencies, 99), 3),
+        'peak_memory_mb': round(max(0, peak - baseline) / 2 ** 20, 2),
+        'api_calls': (google.calls - calls_before) if google else 0,
+    }
+
+
+def percentile(values, q):
+    """q-th percentile by the nearest-rank method"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_backend(backend, size, ops, args):
+    """All workloads for one backend at one history size"""
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{backend}-{size}-")
+    reset_app_state(workdir)
+    google = FakeGoogle(args.latency, args.quota_error_rate, args.seed)
+    if backend == 'sheets':
+        app.STORAGE_BACKEND = 'sheets'
+        client = install_fake_google(google)
+    else:
+        client = None
+        use_local_storage(backend)
+    preload(backend, client, make_history(rng, size))
+
+    results = [measure('list_full', [lambda: list_page(full=True)] * ops['list_full'], google)]
+    results.append(measure('submit', [lambda: submit_ticket(rng)] * ops['submit'], google))
+    results.append(measure('list', [lambda: list_page(full=False)] * ops['list'], google))
+    results.append(measure('filter', [lambda: filter_page(rng)] * ops['filter'], google))
+    results.append(measure(
+        'search', [lambda: app.search_tickets(rng.choice(SEARCH_TERMS), ['SAP'])] * ops['search'], google
+    ))
+
+    open_ids, _ = app.query_tickets('SAP', status='Open', columns=["Ticket ID"])
+    to_close = rng.sample(list(open_ids["Ticket ID"]), min(ops['close'], len(open_ids)))
+    results.append(measure('close', [lambda t=t: close_ticket(t) for t in to_close], google))
+
+    for result in results:
+        result.update(backend=backend, size=size)
+    return results, google
+
+
+# ---------------------------------------------------------------------------
+# Concurrent submissions: ticket IDs must stay unique
+# ---------------------------------------------------------------------------
+
+def _submit_many(db_file, threads, per_thread, seed):
+    """Submit threads x per_thread tickets to the local store from one process; returns the IDs"""
+    app.LOCAL_DB_FILE = db_file
+    use_local_storage()
+    ids = []
+    lock = threading.Lock()
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        for _ in range(per_thread):
+            ticket_id = submit_ticket(rng)
+            with lock:
+                ids.append(ticket_id)
+
+    workers = [threading.Thread(target=worker, args=(seed + i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return ids
+
+
+def run_concurrent_submit(args):
+    """Several processes x threads submitting at once to one local database"""
+    workdir = tempfile.mkdtemp(prefix="bench-concurrent-")
+    reset_app_state(workdir)
+    db_file = app.LOCAL_DB_FILE
+    app._local_connection()  # create the schema before the workers race for it
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.processes) as pool:
+        batches = pool.starmap(
+            _submit_many,
+            [(db_file, args.threads, args.per_thread, args.seed + 1000 * p) for p in range(args.processes)]
+        )
+    elapsed = time.perf_counter() - started
+
+    ids = [ticket_id for batch in batches for ticket_id in batch]
+    use_local_storage()
+    stored = app._local_connection().execute("SELECT COUNT(*), COUNT(DISTINCT ticket_id) FROM tickets").fetchone()
+    return {
+        'workload': 'concurrent_submit',
+        'backend': 'sqlite',
+        'processes': args.processes,
+        'threads': args.threads,
+        'ops': len(ids),
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(len(ids) / elapsed, 2) if elapsed else None,
+        'unique_ids': len(set(ids)),
+        'stored_rows': stored[0],
+        'stored_unique_ids': stored[1],
+        'ok': len(set(ids)) == len(ids) == stored[0] == stored[1],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def git_commit():
+    """Commit hash of the working tree, with -dirty if it has local changes"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    """Print results as a plain-text table"""
+    header = f"{'backend':<8} {'size':>7} {'workload':<18} {'ops':>6} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8} {'API':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if r['workload'] == 'concurrent_submit':
+            print(f"{r['backend']:<8} {'':>7} {r['workload']:<18} {r['ops']:>6} {r['ops_per_second']:>10} "
+                  f"unique IDs: {r['unique_ids']}/{r['ops']}, stored: {r['stored_rows']} -> {'OK' if r['ok'] else 'FAILED'}")
+            continue
+        print(f"{r['backend']:<8} {r['size']:>7} {r['workload']:<18} {r['ops']:>6} {r['ops_per_second']:>10} "
+              f"{r['p50_ms']:>9} {r['p99_ms']:>9} {r['peak_memory_mb']:>8} {r['api_calls']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="existing ticket counts to benchmark (default: 1000 10000 100000)")
+    parser.add_argument("--backends", nargs="+", choices=["sheets", "sqlite", "csv"], default=["sheets", "sqlite"],
+                        help="ticket stores to benchmark (default: sheets sqlite)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every fake Google API call (default: 0)")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0,
+                        help="fraction of fake Google API calls that fail with 429 (default: 0)")
+    parser.add_argument("--ops-scale", type=float, default=1.0,
+                        help="multiply the number of operations per workload")
+    parser.add_argument("--processes", type=int, default=4, help="processes for concurrent_submit")
+    parser.add_argument("--threads", type=int, default=8, help="threads per process for concurrent_submit")
+    parser.add_argument("--per-thread", type=int, default=25, help="submissions per thread for concurrent_submit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    ops = {name: max(1, int(count * args.ops_scale)) for name, count in DEFAULT_OPS.items()}
+    # Keep retries on injected quota errors quick; the backoff schedule itself isn't being measured
+    app.GOOGLE_RETRY_BASE = 0.01
+
+    tracemalloc.start()
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            print(f"Running {backend} with {size} tickets...", file=sys.stderr)
+            backend_results, _ = run_backend(backend, size, ops, args)
+            results.extend(backend_results)
+    tracemalloc.stop()
+
+    print("Running concurrent submissions...", file=sys.stderr)
+    results.append(run_concurrent_submit(args))
+
+    print_results(results)
+
+    report = {
+        'git_commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'sizes': args.sizes,
+            'backends': args.backends,
+            'latency': args.latency,
+            'quota_error_rate': args.quota_error_rate,
+            'ops': ops,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+    if not results[-1]['ok']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
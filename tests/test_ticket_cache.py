@@ -0,0 +1,60 @@
+"""Regression test: building the row index and syncing the snapshot can't deadlock
+
+Run with:
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+import streamlit.logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app outside `streamlit run` logs a warning for every st.* call
+streamlit.logger.set_log_level("error")
+
+import app  # noqa: E402
+import benchmark  # noqa: E402
+
+
+@pytest.fixture
+def fake_sheet(tmp_path, monkeypatch):
+    """A fake "SAP Tickets" worksheet with a few tickets, in Sheets mode"""
+    for name in ('LOCAL_DB_FILE', 'CSV_DIR', 'GOOGLE_RATE_LIMITS', 'GOOGLE_BURST', '_get_google_client_pool'):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    monkeypatch.chdir(tmp_path)
+    benchmark.reset_app_state(str(tmp_path))
+    client = benchmark.install_fake_google(benchmark.FakeGoogle())
+    rng = random.Random(0)
+    tickets = [benchmark.make_ticket(rng, f"SAP-{i}", datetime.now()) for i in range(20)]
+    benchmark.preload('sheets', client, tickets)
+    return client.spreadsheet.sheets["SAP Tickets"]
+
+
+def test_row_index_build_during_snapshot_sync(fake_sheet):
+    # Keep the snapshot sync inside its lock long enough for the lookup to start
+    get_all_values = fake_sheet.get_all_values
+
+    def slow_get_all_values(**kwargs):
+        time.sleep(0.5)
+        return get_all_values(**kwargs)
+
+    fake_sheet.get_all_values = slow_get_all_values
+
+    results = {}
+    sync = threading.Thread(target=lambda: results.update(df=app.get_tickets('SAP')), daemon=True)
+    lookup = threading.Thread(target=lambda: results.update(row=app.lookup_ticket_row('SAP', 'SAP-3')), daemon=True)
+    sync.start()
+    time.sleep(0.1)
+    lookup.start()
+    sync.join(timeout=10)
+    lookup.join(timeout=10)
+
+    assert not sync.is_alive() and not lookup.is_alive(), "snapshot sync and row index lookup deadlocked"
+    assert len(results['df']) == 20
+    assert results['row'] == 5
@@ -0,0 +1,107 @@
+"""Stress test: parallel ticket submissions get unique IDs and every row is stored
+
+Run with:
+    python -m pytest tests
+"""
+import multiprocessing
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+import streamlit.logger
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app outside `streamlit run` logs a warning for every st.* call
+streamlit.logger.set_log_level("error")
+
+import app  # noqa: E402
+
+PROCESSES = 4
+THREADS = 8
+PER_THREAD = 25
+# Everyone submits "in the same second", the case that used to collide
+SUBMITTED_AT = datetime(2025, 1, 6, 9, 30, 0)
+
+
+def _ticket(ticket_id):
+    return {
+        'ticket_id': ticket_id,
+        'type_of_query': 'Issue',
+        'ss_db_dp_name': 'Distributor 1',
+        'ss_db_dp_code': 'DB1000',
+        'city': 'Pune',
+        'state': 'Maharashtra',
+        'incident_category': app.INCIDENT_CATEGORIES[0],
+        'subject': 'Stock mismatch',
+        'call_received_from': 'Caller 1',
+        'received_date': SUBMITTED_AT.strftime("%Y-%m-%d"),
+        'received_time': SUBMITTED_AT.strftime("%H:%M:%S"),
+        'status': 'Open',
+    }
+
+
+def _submit_parallel(db_file, threads, per_thread):
+    """Submit threads x per_thread tickets from this process; returns the allocated IDs"""
+    app.LOCAL_DB_FILE = db_file
+    store = app.SQLiteTicketStore()
+    ids = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(per_thread):
+            try:
+                ticket_id = app.allocate_ticket_id('SAP', SUBMITTED_AT)
+                store.append('SAP', _ticket(ticket_id))
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                ids.append(ticket_id)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    assert not errors, errors
+    return ids
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'local_tickets.db')
+    monkeypatch.setattr(app, 'LOCAL_DB_FILE', path)
+    monkeypatch.chdir(tmp_path)
+    app._ticket_snapshots.clear()
+    app._local_connection()  # create the schema before the workers race for it
+    return path
+
+
+def _stored_ids():
+    return [row[0] for row in app._local_connection().execute("SELECT ticket_id FROM tickets WHERE ticket_type = 'SAP'")]
+
+
+def test_parallel_sessions_get_unique_ids(db_file):
+    ids = _submit_parallel(db_file, THREADS, PER_THREAD)
+
+    assert len(ids) == THREADS * PER_THREAD
+    assert len(set(ids)) == len(ids), "duplicate ticket IDs allocated"
+    assert sorted(_stored_ids()) == sorted(ids), "stored rows don't match the submitted tickets"
+
+
+def test_parallel_server_processes_get_unique_ids(db_file):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(PROCESSES) as pool:
+        batches = pool.starmap(_submit_parallel, [(db_file, THREADS, PER_THREAD)] * PROCESSES)
+    ids = [ticket_id for batch in batches for ticket_id in batch]
+
+    assert len(ids) == PROCESSES * THREADS * PER_THREAD
+    assert len(set(ids)) == len(ids), "duplicate ticket IDs allocated"
+    assert sorted(_stored_ids()) == sorted(ids), "stored rows don't match the submitted tickets"